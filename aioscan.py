@@ -0,0 +1,106 @@
+import os
+import asyncio
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import Result
+
+class FileIO:
+    # Blocking primitives the scanner runs on its thread pool
+    def open(self, path):
+        return os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    
+    def size(self, fd):
+        return os.fstat(fd).st_size
+    
+    def pread(self, fd, size, offset):
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+    
+    def close(self, fd):
+        os.close(fd)
+
+def take(paths, count):
+    return list(islice(paths, count))
+
+class AsyncScanner:
+    # Fetches only the byte ranges the headers need, with at most max_reads
+    # opens and reads in flight, and parses on the event loop while other
+    # files are still waiting on storage
+    def __init__(self, parse, extent, max_reads=32, max_files=None, window=4096, budget=1 << 22, fallback=None, io=None):
+        self.parse_content = parse
+        # Blocking parse of the whole file, for headers spread past the budget
+        self.fallback = fallback
+        self.extent = extent
+        self.max_reads = max_reads
+        self.max_files = max_files or max_reads * 2
+        self.window = window
+        self.budget = budget
+        self.io = io or FileIO()
+        self.executor = ThreadPoolExecutor(max_reads)
+        self.reads = None
+    
+    async def run(self, fn, *args):
+        if self.reads is None:
+            self.reads = asyncio.Semaphore(self.max_reads)
+        
+        async with self.reads:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+    
+    async def fetch(self, path):
+        fd = await self.run(self.io.open, path)
+        try:
+            size = await self.run(self.io.size, fd)
+            data = await self.run(self.io.pread, fd, min(self.window, size), 0)
+            
+            # Each extra read can reveal more of the headers, a few rounds always settle it
+            for _ in range(4):
+                needed = min(self.extent(data), size)
+                if needed <= len(data):
+                    break
+                if needed > self.budget:
+                    if self.fallback is None:
+                        raise ValueError(f"headers span {needed} bytes, over the {self.budget} byte budget")
+                    return None, size
+                data += await self.run(self.io.pread, fd, needed - len(data), len(data))
+        finally:
+            await self.run(self.io.close, fd)
+        
+        return data, size
+    
+    async def parse(self, path):
+        data, size = await self.fetch(path)
+        if data is None:
+            return await self.run(self.fallback, path)
+        return self.parse_content(path, data, size)
+    
+    async def attempt(self, path):
+        try:
+            return Result(path, await self.parse(path))
+        except Exception as e:
+            return Result(path, error=f"{type(e).__name__}: {e}")
+    
+    async def scan(self, paths):
+        paths = iter(paths)
+        pending = set()
+        more = True
+        
+        while True:
+            # Walking directories and reading file lists blocks too, so the
+            # next paths are taken on the pool as well
+            if more and len(pending) < self.max_files:
+                taken = await asyncio.get_running_loop().run_in_executor(self.executor, take, paths, self.max_files - len(pending))
+                more = bool(taken)
+                pending.update(asyncio.ensure_future(self.attempt(path)) for path in taken)
+            
+            if not pending:
+                break
+            
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,232 @@
+import math
+import hashlib
+from collections import Counter
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK = 1 << 20
+
+# DER encoded digest algorithm OIDs as they appear in Authenticode signatures
+DIGEST_OIDS = {
+    bytes.fromhex("2a864886f70d0205"): "md5",
+    bytes.fromhex("2b0e03021a"): "sha1",
+    bytes.fromhex("608648016503040201"): "sha256",
+    bytes.fromhex("608648016503040202"): "sha384",
+    bytes.fromhex("608648016503040203"): "sha512",
+}
+
+WIN_CERT_TYPE_PKCS_SIGNED_DATA = 2
+
+@dataclass(slots=True)
+class SectionAnalysis:
+    name: str
+    size: int
+    md5: str
+    sha256: str
+    entropy: float
+    
+    def to_dict(self):
+        return {"name": self.name, "size": self.size, "md5": self.md5, "sha256": self.sha256, "entropy": self.entropy}
+    
+    def __str__(self):
+        res = f"{self.name:>40} : entropy {self.entropy:.4f}\n"
+        res += " "*43 + f"md5 {self.md5}\n"
+        res += " "*43 + f"sha256 {self.sha256}\n"
+        return res
+
+def count_bytes(counts, chunk):
+    if np is not None:
+        counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+    else:
+        for byte, n in Counter(chunk).items():
+            counts[byte] += n
+
+def entropy(counts, total):
+    if not total:
+        return 0.0
+    
+    res = 0.0
+    for n in counts:
+        if n:
+            p = int(n) / total
+            res -= p * math.log2(p)
+    return res
+
+def analyse_section(content, name, offset, size, chunk_size=CHUNK):
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    counts = np.zeros(256, dtype=np.int64) if np is not None else [0] * 256
+    total = 0
+    
+    # One pass feeds the hashes and the histogram from the same chunk
+    for chunk in content.chunks(offset, size, chunk_size):
+        md5.update(chunk)
+        sha256.update(chunk)
+        count_bytes(counts, chunk)
+        total += len(chunk)
+    
+    return SectionAnalysis(name, total, md5.hexdigest(), sha256.hexdigest(), entropy(counts, total))
+
+def imphash(imports):
+    names = []
+    for dll in imports:
+        base = dll.name.lower()
+        if base.rsplit(".", 1)[-1] in ("dll", "ocx", "sys"):
+            base = base.rsplit(".", 1)[0]
+        
+        for function in dll.functions:
+            name = function.name if function.name is not None else f"ord{function.ordinal}"
+            names.append(f"{base}.{name.lower()}")
+    
+    return hashlib.md5(",".join(names).encode()).hexdigest() if names else None
+
+@dataclass(slots=True)
+class Verification:
+    stored_checksum: int
+    checksum: int
+    algorithm: str
+    digest: str
+    signed_digest: str | None = None
+    
+    @property
+    def checksum_ok(self):
+        # Plenty of user mode images leave the checksum at 0, which means "not set"
+        return self.stored_checksum == 0 or self.stored_checksum == self.checksum
+    
+    @property
+    def signature_ok(self):
+        return None if self.signed_digest is None else self.signed_digest == self.digest
+    
+    def to_dict(self):
+        return {
+            "stored_checksum": self.stored_checksum,
+            "checksum": self.checksum,
+            "checksum_ok": self.checksum_ok,
+            "algorithm": self.algorithm,
+            "digest": self.digest,
+            "signed_digest": self.signed_digest,
+            "signature_ok": self.signature_ok,
+        }
+    
+    def __str__(self):
+        if self.stored_checksum == 0:
+            state = "not set"
+        else:
+            state = "ok" if self.checksum_ok else "MISMATCH"
+        
+        if self.signed_digest is None:
+            signature = "not signed"
+        else:
+            signature = "ok" if self.signature_ok else f"MISMATCH, signed {self.signed_digest}"
+        
+        res = f"{'Checksum':>40} : {hex(self.checksum)} (stored {hex(self.stored_checksum)}, {state})\n"
+        res += f"{'Authenticode ' + self.algorithm.upper():>40} : {self.digest}\n"
+        res += f"{'Signature':>40} : {signature}\n"
+        return res
+
+def der(data, pos):
+    # Returns the tag and the bounds of the value of the DER element at pos
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        n = length & 0x7f
+        length = int.from_bytes(data[pos:pos + n], "big")
+        pos += n
+    return tag, pos, pos + length
+
+def der_children(data, start, end):
+    pos = start
+    while pos < end:
+        tag, value, pos = der(data, pos)
+        yield tag, value, pos
+
+def der_child(data, element, index):
+    _, start, end = element
+    return list(der_children(data, start, end))[index]
+
+def signed_digest(certificate):
+    try:
+        content_info = der(certificate, 0)
+        signed_data = der_child(certificate, der_child(certificate, content_info, 1), 0)
+        spc_content_info = der_child(certificate, signed_data, 2)
+        spc_indirect_data = der_child(certificate, der_child(certificate, spc_content_info, 1), 0)
+        digest_info = der_child(certificate, spc_indirect_data, 1)
+        oid = der_child(certificate, der_child(certificate, digest_info, 0), 0)
+        digest = der_child(certificate, digest_info, 1)
+    except (IndexError, ValueError):
+        return None, None
+    
+    name = DIGEST_OIDS.get(bytes(certificate[oid[1]:oid[2]]))
+    return name, bytes(certificate[digest[1]:digest[2]]).hex()
+
+def read_signature(content, offset, size):
+    # The first PKCS#7 WIN_CERTIFICATE in the certificate table, if there is one
+    end = offset + size
+    while offset + 8 <= end:
+        header = bytes(content[offset:offset + 8])
+        length = int.from_bytes(header[:4], "little")
+        kind = int.from_bytes(header[6:8], "little")
+        if length < 8:
+            break
+        
+        if kind == WIN_CERT_TYPE_PKCS_SIGNED_DATA:
+            return signed_digest(bytes(content[offset + 8:offset + length]))
+        offset += (length + 7) & ~7
+    
+    return None, None
+
+def byte_sums(chunk):
+    if np is not None:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        return int(data[0::2].sum(dtype=np.uint64)), int(data[1::2].sum(dtype=np.uint64))
+    return sum(chunk[0::2]), sum(chunk[1::2])
+
+def verify(content, checksum_offset, directory_offset, cert_offset, cert_size, chunk_size=CHUNK):
+    length = len(content)
+    stored = int.from_bytes(content[checksum_offset:checksum_offset + 4], "little")
+    
+    algorithm, expected = None, None
+    if cert_size and cert_offset + cert_size <= length:
+        algorithm, expected = read_signature(content, cert_offset, cert_size)
+    algorithm = algorithm or "sha256"
+    digest = hashlib.new(algorithm)
+    
+    # Authenticode skips the checksum, the certificate table directory entry and the table itself
+    skipped = sorted([
+        (checksum_offset, checksum_offset + 4),
+        (directory_offset, directory_offset + 8),
+        (cert_offset, cert_offset + cert_size) if cert_size else (length, length),
+    ])
+    
+    total = 0
+    position = 0
+    for chunk in content.chunks(0, length, chunk_size):
+        low, high = byte_sums(chunk)
+        total += (high << 8) + low if position % 2 == 0 else (low << 8) + high
+        
+        end = position + len(chunk)
+        cursor = position
+        for start, stop in skipped:
+            if stop <= cursor or start >= end:
+                continue
+            if start > cursor:
+                digest.update(chunk[cursor - position:start - position])
+            cursor = max(cursor, min(stop, end))
+        if cursor < end:
+            digest.update(chunk[cursor - position:])
+        
+        position = end
+    
+    # The checksum field itself counts as zero
+    for i, byte in enumerate(bytes(content[checksum_offset:checksum_offset + 4])):
+        total -= byte << (8 * ((checksum_offset + i) % 2))
+    
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    
+    return Verification(stored, total + length, algorithm, digest.hexdigest(), expected)
@@ -0,0 +1,100 @@
+import os
+import sys
+import glob
+from dataclasses import dataclass
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+@dataclass
+class Result:
+    path: str
+    value: object = None
+    error: str | None = None
+
+def is_pattern(target):
+    return any(c in target for c in "*?[")
+
+def iter_paths(targets, file_list=None):
+    for target in targets:
+        if os.path.isdir(target):
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        elif is_pattern(target):
+            for path in glob.iglob(target, recursive=True):
+                if os.path.isfile(path):
+                    yield path
+        else:
+            yield target
+    
+    if file_list is not None:
+        f = sys.stdin if file_list == "-" else open(file_list)
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        finally:
+            # stdin belongs to the caller
+            if f is not sys.stdin:
+                f.close()
+
+def failed(paths, e):
+    return [Result(path, error=f"{type(e).__name__}: {e}") for path in paths]
+
+def run_chunk(worker, paths):
+    results = []
+    for path in paths:
+        # One bad file only costs its own result, never the rest of the chunk
+        try:
+            results.append(Result(path, worker(path)))
+        except Exception as e:
+            results.extend(failed([path], e))
+    
+    return results
+
+def scan(paths, worker, workers=None, chunksize=16):
+    workers = workers or os.cpu_count() or 1
+    paths = iter(paths)
+    
+    if workers == 1:
+        for path in paths:
+            yield from run_chunk(worker, [path])
+        return
+    
+    pool = ProcessPoolExecutor(workers)
+    try:
+        # Only keep a couple of chunks queued per worker so huge trees don't pile up in memory
+        pending = {}
+        while True:
+            while len(pending) < workers * 2:
+                chunk = list(islice(paths, chunksize))
+                if not chunk:
+                    break
+                pending[pool.submit(run_chunk, worker, chunk)] = chunk
+            
+            if not pending:
+                break
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            if not any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                for future in done:
+                    yield from future.result()
+                    del pending[future]
+                continue
+            
+            # A worker died (OOM kill, segfault), which takes down every chunk in
+            # flight with it. Those files are reported and the rest of the run
+            # goes on in a new pool.
+            for future, chunk in pending.items():
+                if future.exception() is None:
+                    yield from future.result()
+                else:
+                    yield from failed(chunk, future.exception())
+            pending = {}
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = ProcessPoolExecutor(workers)
+    finally:
+        pool.shutdown()
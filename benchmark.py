@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import timeit
+import asyncio
+import argparse
+import resource
+import tempfile
+import importlib
+import subprocess
+
+import aioscan
+import synthetic
+
+pe = importlib.import_module("pe-examine")
+
+HEADERS = {
+    "MS-DOS Stub": pe.DOSHEADER,
+    "COFF File Header": pe.COFFHEADER,
+    "PE32 Header": pe.PE32HEADER,
+    "PE32 Data Directories": pe.PE32DATADIRECTORIES,
+    "PE32+ Header": pe.PE32PLUSHEADER,
+    "PE32+ Data Directories": pe.PE32PLUSDATADIRECTORIES,
+    "Section Header": pe.SECTIONHEADERS,
+}
+
+def legacy_decode(fields, content, start):
+    # The per-field loop Header.populate_fields used before the tables were compiled
+    values = {}
+    for field in fields:
+        offset = start + field.offset
+        data = content[offset:offset + field.size]
+        values[pe.format_name(field.name)] = int.from_bytes(data, "little") if field.int else data
+    
+    return values
+
+def compiled_decode(fields, content, start):
+    return fields.struct.unpack_from(content, start)
+
+def bench_headers(number):
+    content = memoryview(os.urandom(4096))
+    
+    print(f"{'Header':>30} {'per-field':>12} {'compiled':>12} {'speedup':>8}")
+    for name, fields in HEADERS.items():
+        legacy = timeit.timeit(lambda: legacy_decode(fields, content, 64), number=number)
+        compiled = timeit.timeit(lambda: compiled_decode(fields, content, 64), number=number)
+        
+        legacy_us = legacy / number * 1e6
+        compiled_us = compiled / number * 1e6
+        print(f"{name:>30} {legacy_us:>10.2f}us {compiled_us:>10.2f}us {legacy / compiled:>7.1f}x")
+
+def bench_render(corpus, rounds):
+    def run(render):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for path in corpus:
+                with pe.Executable(path) as exe:
+                    if render:
+                        str(exe)
+        return (time.perf_counter() - start) / (rounds * len(corpus))
+    
+    parse = run(False)
+    rendered = run(True)
+    
+    print(f"{'Corpus files':>30} {len(corpus):>12}")
+    print(f"{'parse only':>30} {parse * 1e6:>10.2f}us")
+    print(f"{'parse + render':>30} {rendered * 1e6:>10.2f}us")
+    print(f"{'render share':>30} {(rendered - parse) / rendered:>11.1%}")
+
+class SlowIO(aioscan.FileIO):
+    # Adds a fixed delay to every open and read, like a network filesystem would
+    def __init__(self, latency):
+        self.latency = latency
+    
+    def open(self, path):
+        time.sleep(self.latency)
+        return super().open(path)
+    
+    def pread(self, fd, size, offset):
+        time.sleep(self.latency)
+        return super().pread(fd, size, offset)
+
+def bench_latency(corpus, latency, reads):
+    io = SlowIO(latency)
+    
+    def serial():
+        for path in corpus:
+            fd = io.open(path)
+            try:
+                data = io.pread(fd, io.size(fd), 0)
+            finally:
+                io.close(fd)
+            pe.parse_prefix(path, data, len(data))
+    
+    async def concurrent():
+        scanner = pe.async_scanner(reads, io=io)
+        try:
+            async for result in scanner.scan(corpus):
+                pass
+        finally:
+            scanner.close()
+    
+    start = time.perf_counter()
+    serial()
+    serial_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    asyncio.run(concurrent())
+    async_time = time.perf_counter() - start
+    
+    print(f"{'Latency per op':>30} {latency * 1e3:>10.2f}ms")
+    print(f"{'serial':>30} {len(corpus) / serial_time:>10.1f} files/s")
+    print(f"{f'async ({reads} reads)':>30} {len(corpus) / async_time:>10.1f} files/s")
+
+# Metrics where a higher number is better, every other one regresses by going up
+HIGHER_IS_BETTER = ("files_per_second",)
+# Metrics that regress by changing at all, a parser that fails sooner isn't faster
+EXACT = ("errors",)
+
+def percentiles(samples, quantiles=(50, 90, 99)):
+    samples = sorted(samples)
+    return {f"p{q}_us": samples[min(len(samples) - 1, len(samples) * q // 100)] * 1e6 for q in quantiles}
+
+def bench_parse(corpus, rounds, analyses=()):
+    latencies = []
+    errors = 0
+    # The first pass warms the page cache and the string pool and isn't counted
+    for i in range(rounds + 1):
+        for path in corpus:
+            start = time.perf_counter()
+            try:
+                pe.record(path, analyses)
+            except Exception:
+                errors += i > 0
+            if i:
+                latencies.append(time.perf_counter() - start)
+    
+    return {
+        "files_per_second": len(latencies) / sum(latencies),
+        **percentiles(latencies),
+        # Files that failed to parse in one pass
+        "errors": errors // rounds,
+        # Peak of the whole benchmark process so far, not just this stage
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def bench_cli(corpus, workers):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt") as paths, tempfile.NamedTemporaryFile("r", suffix=".jsonl") as out:
+        paths.write("\n".join(corpus) + "\n")
+        paths.flush()
+        
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pe-examine.py")
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, script, "-l", paths.name, "-f", "jsonl", "-o", out.name, "-j", str(workers)],
+            check=True,
+        )
+        elapsed = time.perf_counter() - start
+        errors = sum("error" in json.loads(line) for line in out)
+    
+    return {
+        "files_per_second": len(corpus) / elapsed,
+        "errors": errors,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+def suite(corpus, rounds, workers):
+    return {
+        "parse": bench_parse(corpus, rounds),
+        "parse_analyses": bench_parse(corpus, 1, ("imports", "exports", "section_analysis", "verification", "resources")),
+        "cli": bench_cli(corpus, workers),
+    }
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'Metric':>30} {'baseline':>12} {'current':>12} {'change':>8}")
+    for stage, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(stage, {}).get(name)
+            if name in EXACT and old is not None:
+                flag = " REGRESSION" if value != old else ""
+                if flag:
+                    regressions.append(f"{stage}.{name}")
+                print(f"{stage + '.' + name:>30} {old:>12} {value:>12} {value - old:>+8}{flag}")
+                continue
+            if not old:
+                continue
+            
+            change = (value - old) / old
+            worse = -change if name in HIGHER_IS_BETTER else change
+            flag = " REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{stage}.{name}")
+            print(f"{stage + '.' + name:>30} {old:>12.1f} {value:>12.1f} {change:>+7.1%}{flag}")
+    
+    return regressions
+
+def run_suite(args, corpus):
+    results = suite(corpus, args.rounds, args.workers)
+    
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed (tolerance {args.tolerance:.0%}, error counts must match): {', '.join(regressions)}")
+            return 1
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+def main(args):
+    if args.synthetic:
+        with tempfile.TemporaryDirectory(prefix="pe-corpus-") as directory:
+            args.corpus = args.corpus + synthetic.generate(directory, args.synthetic, args.seed, args.malformed, size=args.size)
+            args.synthetic = 0
+            return main(args)
+    
+    if args.suite or args.baseline or args.save_baseline:
+        return run_suite(args, args.corpus)
+    
+    bench_headers(args.number)
+    
+    if args.corpus:
+        print()
+        bench_render(args.corpus, args.rounds)
+        
+        if args.latency:
+            print()
+            bench_latency(args.corpus, args.latency / 1000, args.reads)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parser micro-benchmarks")
+    parser.add_argument("corpus", nargs="*", help="PE files to parse and render")
+    parser.add_argument("-n", "--number", type=int, default=100000, help="header decodes per measurement")
+    parser.add_argument("-r", "--rounds", type=int, default=20, help="passes over the corpus")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N", help="add N generated files to the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated corpus")
+    parser.add_argument("--malformed", type=float, default=0.05, help="share of malformed generated files")
+    parser.add_argument("--size", type=int, default=0, help="pad generated files to about this many bytes")
+    parser.add_argument("--suite", action="store_true", help="measure throughput, latency percentiles and peak RSS instead of the micro-benchmarks")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes for the CLI run")
+    parser.add_argument("--baseline", help="compare the suite against results saved with --save-baseline, exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="save the suite results here")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change that counts as a regression")
+    parser.add_argument("--latency", type=float, default=0, help="simulated storage latency in ms for the async benchmark")
+    parser.add_argument("--reads", type=int, default=32, help="reads in flight for the async benchmark")
+    sys.exit(main(parser.parse_args()))
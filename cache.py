@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import hashlib
+
+# Bump when the table layout below or the layout of the records changes
+SCHEMA = 3
+
+TABLES = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT);
+CREATE TABLE IF NOT EXISTS results (hash TEXT PRIMARY KEY, record TEXT, size INTEGER, used INTEGER);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    buffer = bytearray(1 << 20)
+    view = memoryview(buffer)
+    
+    with open(path, "rb") as f:
+        while n := f.readinto(buffer):
+            digest.update(view[:n])
+    
+    return digest.hexdigest()
+
+class ResultCache:
+    def __init__(self, path, version, max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(TABLES)
+        
+        # Records decoded with other field definitions can't be trusted, so start over
+        version = f"{SCHEMA}:{version}"
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.db.execute("DELETE FROM files")
+            self.db.execute("DELETE FROM results")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.db.commit()
+        
+        self.clock = self.db.execute("SELECT COALESCE(MAX(used), 0) FROM results").fetchone()[0]
+        self.pending = 0
+    
+    def get(self, path, size, mtime):
+        row = self.db.execute(
+            "SELECT r.hash, r.record FROM files f JOIN results r ON r.hash = f.hash "
+            "WHERE f.path = ? AND f.size = ? AND f.mtime = ?",
+            (path, size, mtime),
+        ).fetchone()
+        
+        if row is None:
+            return None
+        
+        self.touch(row[0])
+        return load(row[1], path)
+    
+    def put(self, path, size, mtime, digest, record):
+        data = json.dumps(record, separators=(",", ":"))
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, size, mtime, digest))
+        self.db.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?, 0)", (digest, data, len(data)))
+        self.touch(digest)
+    
+    def touch(self, digest):
+        self.clock += 1
+        self.db.execute("UPDATE results SET used = ? WHERE hash = ?", (self.clock, digest))
+        
+        self.pending += 1
+        if self.pending >= 10000:
+            self.flush()
+    
+    def flush(self):
+        self.evict()
+        self.db.commit()
+        self.pending = 0
+    
+    def evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        # Drop least recently used records until the cache fits again
+        excess = total - self.max_bytes
+        victims = []
+        for digest, size in self.db.execute("SELECT hash, size FROM results ORDER BY used"):
+            victims.append((digest,))
+            excess -= size
+            if excess <= 0:
+                break
+        
+        self.db.executemany("DELETE FROM results WHERE hash = ?", victims)
+        self.db.execute("DELETE FROM files WHERE hash NOT IN (SELECT hash FROM results)")
+    
+    def close(self):
+        self.flush()
+        self.db.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+def load(data, path):
+    record = json.loads(data)
+    record["path"] = path
+    return record
+
+_readers = {}
+
+def reader(path):
+    # Read-only connection for pool workers, opened once per process
+    if path not in _readers:
+        _readers[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return _readers[path]
+
+def lookup_hash(path, digest, file_path):
+    row = reader(path).execute("SELECT record FROM results WHERE hash = ?", (digest,)).fetchone()
+    return None if row is None else load(row[0], file_path)
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import heapq
+import argparse
+import tempfile
+import importlib
+from dataclasses import dataclass
+from itertools import groupby, zip_longest
+
+import output
+
+HEADERS = ("format", "dos", "coff", "optional", "data_directories")
+
+# Records sorted in memory at a time before they are spilled to a run file
+RUN_SIZE = 100000
+
+@dataclass(frozen=True, slots=True)
+class Difference:
+    key: str
+    field: str
+    old: object = None
+    new: object = None
+    
+    def to_dict(self):
+        return {"key": self.key, "field": self.field, "old": self.old, "new": self.new}
+    
+    def __str__(self):
+        return f"{self.key}: {self.field} : {self.old} -> {self.new}"
+
+def section_names(sections):
+    # Duplicate section names are told apart by how often they came up before
+    seen = {}
+    names = []
+    for section in sections:
+        name = bytes.fromhex(section["header_name"]).rstrip(b"\x00").decode("latin-1")
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}#{seen[name]}")
+    return names
+
+def diff_dicts(key, prefix, old, new):
+    for name in sorted(old.keys() | new.keys()):
+        if old.get(name) != new.get(name):
+            yield Difference(key, prefix + name, old.get(name), new.get(name))
+
+def diff_records(old, new, key=None):
+    key = key or new["path"]
+    for header in HEADERS:
+        a, b = old.get(header), new.get(header)
+        if isinstance(a, dict) or isinstance(b, dict):
+            yield from diff_dicts(key, header + ".", a or {}, b or {})
+        elif a != b:
+            yield Difference(key, header, a, b)
+    
+    old_sections = dict(zip(section_names(old["sections"]), old["sections"]))
+    new_sections = dict(zip(section_names(new["sections"]), new["sections"]))
+    for name in old_sections.keys() - new_sections.keys():
+        yield Difference(key, f"sections.{name}", "present", None)
+    for name in new_sections.keys() - old_sections.keys():
+        yield Difference(key, f"sections.{name}", None, "present")
+    
+    for name in sorted(old_sections.keys() & new_sections.keys()):
+        yield from diff_dicts(key, f"sections.{name}.", old_sections[name], new_sections[name])
+
+def diff_executables(old, new):
+    yield from diff_records(old.to_record(), new.to_record(), str(new.filename))
+
+def record_key(record, key, root=None):
+    if key == "hash":
+        # Without it every file would share the key "" and be paired up by path
+        if not record.get("sha256"):
+            raise ValueError(f"{record['path']} has no sha256, scan with --hash to match by content")
+        return record["sha256"]
+    
+    path = record["path"]
+    return os.path.relpath(path, root) if root is not None else path
+
+def read_records(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def spill(run):
+    run.sort(key=lambda item: item[0])
+    f = tempfile.TemporaryFile("w+")
+    for item in run:
+        f.write(json.dumps(item, separators=(",", ":")) + "\n")
+    f.seek(0)
+    return f
+
+def read_run(f):
+    for line in f:
+        yield tuple(json.loads(line))
+
+def sorted_records(records, key, root=None, run_size=RUN_SIZE):
+    # External merge sort, so only run_size records are ever held in memory
+    runs = []
+    run = []
+    for record in records:
+        if "error" in record:
+            continue
+        run.append(((record_key(record, key, root), record_key(record, "path", root)), record))
+        if len(run) >= run_size:
+            runs.append(spill(run))
+            run = []
+    
+    if not runs:
+        run.sort(key=lambda item: item[0])
+        yield from ((tuple(k), record) for k, record in run)
+        return
+    
+    runs.append(spill(run))
+    try:
+        for k, record in heapq.merge(*[read_run(f) for f in runs], key=lambda item: item[0]):
+            yield tuple(k), record
+    finally:
+        for f in runs:
+            f.close()
+
+def pair(key, old, new):
+    # Files sharing a key are paired up by path first, the rest in path order
+    paths = {item[0][1]: item for item in new}
+    unmatched = []
+    for item in old:
+        match = paths.pop(item[0][1], None)
+        if match is None:
+            unmatched.append(item)
+        else:
+            yield key, item[1], match[1]
+    
+    for x, y in zip_longest(unmatched, paths.values()):
+        yield key, x and x[1], y and y[1]
+
+def merge_join(old, new):
+    # Both sides come sorted by key, so one pass pairs them up
+    old = groupby(old, key=lambda item: item[0][0])
+    new = groupby(new, key=lambda item: item[0][0])
+    a = next(old, None)
+    b = next(new, None)
+    
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            key, group, other = a[0], list(a[1]), []
+            a = next(old, None)
+        elif a is None or b[0] < a[0]:
+            key, group, other = b[0], [], list(b[1])
+            b = next(new, None)
+        else:
+            key, group, other = a[0], list(a[1]), list(b[1])
+            a = next(old, None)
+            b = next(new, None)
+        
+        yield from pair(key, group, other)
+
+def diff_results(old, new, key="path", old_root=None, new_root=None, run_size=RUN_SIZE):
+    pairs = merge_join(
+        sorted_records(old, key, old_root, run_size),
+        sorted_records(new, key, new_root, run_size),
+    )
+    
+    for k, a, b in pairs:
+        if a is None:
+            yield Difference(k, "file", None, b["path"])
+        elif b is None:
+            yield Difference(k, "file", a["path"], None)
+        else:
+            yield from diff_records(a, b, k)
+
+def main(args):
+    out = sys.stdout if args.output is None else open(args.output, "w", newline="")
+    
+    if args.results:
+        differences = diff_results(
+            read_records(args.old),
+            read_records(args.new),
+            args.key,
+            args.old_root,
+            args.new_root,
+        )
+    else:
+        pe = importlib.import_module("pe-examine")
+        with pe.Executable(args.old) as old, pe.Executable(args.new) as new:
+            differences = list(diff_executables(old, new))
+    
+    with output.writer(args.format, out, ["key", "field", "old", "new"]) as writer:
+        for difference in differences:
+            writer.write(str(difference) if args.format == "text" else difference.to_dict())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the headers of two PE files or two scans")
+    parser.add_argument("old", help="PE file, or JSON Lines scan results with -r")
+    parser.add_argument("new", help="PE file, or JSON Lines scan results with -r")
+    parser.add_argument("-r", "--results", action="store_true", help="compare two -f jsonl scans instead of two files")
+    parser.add_argument("-k", "--key", choices=["path", "hash"], default="path", help="match scanned files by path or by content hash (needs --hash scans)")
+    parser.add_argument("--old-root", help="match old paths relative to this directory")
+    parser.add_argument("--new-root", help="match new paths relative to this directory")
+    parser.add_argument("-f", "--format", choices=["text", "jsonl", "csv"], default="text", help="output format")
+    parser.add_argument("-o", "--output", help="write differences to this file instead of stdout")
+    args = parser.parse_args()
+    try:
+        main(args)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import batch
+
+pe = importlib.import_module("pe-examine")
+
+# Analyses a request may ask for, they end up as attribute lookups on Executable
+ANALYSES = {"imports", "exports", "section_analysis", "verification", "resources", "version_info", "relocations"}
+
+def handle(request):
+    # Runs in the workers, which import the parser once and then stay warm.
+    # The response is encoded here too, bytes cross the process boundary far
+    # cheaper than a nested record would.
+    path = request["path"]
+    response = {"id": request.get("id"), "path": path}
+    try:
+        analyses = tuple(request.get("analyses", ()))
+        if not ANALYSES.issuperset(analyses):
+            raise ValueError(f"unknown analyses {sorted(set(analyses) - ANALYSES)}")
+        
+        if request.get("format") == "text":
+            response["text"] = pe.report(path, analyses)
+        else:
+            response["record"] = pe.record(path, analyses)
+    except Exception as e:
+        response["error"] = f"{type(e).__name__}: {e}"
+    
+    return encode(response)
+
+def warm():
+    return os.getpid()
+
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+class Daemon:
+    # Requests are newline delimited JSON objects with an absolute path and
+    # optionally an id, analyses and "format": "text". Responses carry the id
+    # back and may arrive out of order. Once the queue is full, connections are
+    # not read from until it drains, so clients feel the backpressure on their
+    # socket.
+    def __init__(self, path, workers=None, queue_size=256, threads=False):
+        self.path = path
+        self.workers = workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.threads = threads
+        self.served = 0
+        self.restarts = 0
+        self.started = time.monotonic()
+    
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+        self.executor = self.start_executor()
+        
+        # Start every worker process before the first request has to wait for one
+        await asyncio.gather(*[loop.run_in_executor(self.executor, warm) for _ in range(self.workers)])
+        tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        
+        if os.path.exists(self.path):
+            # Left behind by a daemon that didn't shut down cleanly
+            os.unlink(self.path)
+        # Created owner only from the start, a chmod afterwards leaves a window
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.connection, self.path)
+        finally:
+            os.umask(umask)
+        
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.executor.shutdown(cancel_futures=True)
+            os.unlink(self.path)
+    
+    def start_executor(self):
+        if self.threads:
+            return ThreadPoolExecutor(self.workers)
+        return ProcessPoolExecutor(self.workers)
+    
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, future = await self.queue.get()
+            executor = self.executor
+            try:
+                response = await loop.run_in_executor(executor, handle, request)
+            except Exception as e:
+                # The worker itself failed, not the parse
+                response = encode({"id": request.get("id"), "path": request.get("path"), "error": f"{type(e).__name__}: {e}"})
+                if isinstance(e, BrokenProcessPool) and self.executor is executor:
+                    # A dead worker breaks the whole pool, so start a new one
+                    # unless another task already has
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = self.start_executor()
+                    self.restarts += 1
+            self.served += 1
+            
+            if not future.done():
+                future.set_result(response)
+    
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "served": self.served,
+            "restarts": self.restarts,
+            "uptime": time.monotonic() - self.started,
+        }
+    
+    async def connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+        pending = set()
+        
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Over the reader's limit, and where the next request starts is lost with it
+                    await self.send(writer, lock, encode({"id": None, "error": "request too long"}))
+                    break
+                if not line:
+                    break
+                
+                request = None
+                try:
+                    request = json.loads(line)
+                    if request.get("op") == "stats":
+                        await self.send(writer, lock, encode({**self.stats(), "id": request.get("id")}))
+                        continue
+                    # Anything but a file name could make a worker read its own
+                    # descriptors (an int path) or the daemon's stdin ("-"), and
+                    # relative names would resolve against the daemon's directory
+                    path = request["path"]
+                    if not isinstance(path, str) or not os.path.isabs(path):
+                        raise ValueError(path)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    id = request.get("id") if isinstance(request, dict) else None
+                    await self.send(writer, lock, encode({"id": id, "error": "bad request"}))
+                    continue
+                
+                future = loop.create_future()
+                await self.queue.put((request, future))
+                task = asyncio.create_task(self.reply(writer, lock, future))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            
+            if pending:
+                await asyncio.gather(*pending)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def reply(self, writer, lock, future):
+        await self.send(writer, lock, await future)
+    
+    async def send(self, writer, lock, data):
+        async with lock:
+            writer.write(data)
+            await writer.drain()
+
+class Client:
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.file = self.socket.makefile("rb")
+        self.next_id = 0
+    
+    def request(self, message):
+        self.socket.sendall(encode(message))
+        return json.loads(self.file.readline())
+    
+    def scan(self, path, analyses=(), format="record"):
+        self.next_id += 1
+        return self.request({"id": self.next_id, "path": os.path.abspath(path), "analyses": list(analyses), "format": format})
+    
+    def scan_many(self, paths, analyses=(), format="record", window=64):
+        # Keeps up to window requests in flight and yields responses as they come back
+        paths = iter(paths)
+        in_flight = 0
+        while True:
+            for path in paths:
+                self.next_id += 1
+                self.socket.sendall(encode({"id": self.next_id, "path": os.path.abspath(path), "analyses": list(analyses), "format": format}))
+                in_flight += 1
+                if in_flight >= window:
+                    break
+            
+            if not in_flight:
+                break
+            
+            yield json.loads(self.file.readline())
+            in_flight -= 1
+    
+    def stats(self):
+        return self.request({"op": "stats"})
+    
+    def close(self):
+        self.file.close()
+        self.socket.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+def main(args):
+    if args.command == "serve":
+        daemon = Daemon(args.socket, args.workers, args.queue_size, args.threads)
+        asyncio.run(daemon.serve())
+        return
+    
+    with Client(args.socket) as client:
+        if args.command == "stats":
+            print(json.dumps(client.stats()))
+            return
+        
+        analyses = tuple(args.analyses or ())
+        for response in client.scan_many(batch.iter_paths(args.targets), analyses, args.format):
+            if args.format == "text" and "text" in response:
+                print(response["text"])
+            else:
+                print(json.dumps(response, separators=(",", ":")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep PE parsers warm and serve scans over a Unix socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    serve = commands.add_parser("serve", help="run the daemon")
+    serve.add_argument("socket", help="path of the Unix socket to listen on")
+    serve.add_argument("-j", "--workers", type=int, help="worker processes (default: all cores)")
+    serve.add_argument("-q", "--queue-size", type=int, default=256, help="requests waiting for a worker before clients are held back")
+    serve.add_argument("--threads", action="store_true", help="parse in threads instead of processes")
+    
+    scan = commands.add_parser("scan", help="scan files through a running daemon")
+    scan.add_argument("socket", help="path of the daemon's Unix socket")
+    scan.add_argument("targets", nargs="+", help="files, directories or glob patterns")
+    scan.add_argument("-f", "--format", choices=["record", "text"], default="record", help="JSON records or the text report")
+    scan.add_argument("--imports", dest="analyses", action="append_const", const="imports", help="list imported DLLs and functions")
+    scan.add_argument("--exports", dest="analyses", action="append_const", const="exports", help="list exported functions")
+    scan.add_argument("--section-analysis", dest="analyses", action="append_const", const="section_analysis", help="hash each section and measure its entropy")
+    scan.add_argument("--verify", dest="analyses", action="append_const", const="verification", help="verify the PE checksum and the Authenticode digest")
+    scan.add_argument("--resources", dest="analyses", action="append_const", const="resources", help="walk the resource tree")
+    scan.add_argument("--version-info", dest="analyses", action="append_const", const="version_info", help="extract version information strings")
+    scan.add_argument("--relocations", dest="analyses", action="append_const", const="relocations", help="count base relocations by type")
+    
+    stats = commands.add_parser("stats", help="show the daemon's queue and counters")
+    stats.add_argument("socket", help="path of the daemon's Unix socket")
+    
+    main(parser.parse_args())
@@ -1,4 +1,5 @@
 from enum import Enum, IntEnum, Flag
+from functools import lru_cache
 
 class Characteristics(Flag):
     IMAGE_FILE_RELOCS_STRIPPED = 0x1
@@ -230,7 +231,7 @@ windowssubsystem_descs = {
     "IMAGE_SUBSYSTEM_WINDOWS_CUI": "Windows character subsystem",
     "IMAGE_SUBSYSTEM_OS2_CUI": "OS/2 character subsystem",
     "IMAGE_SUBSYSTEM_POSIX_CUI": "Posix character subsystem",
-    "IMAGE_SUBSYSTEM_WINDOWS_NATIVE_WINDOWS": "Native Win9x driver",
+    "IMAGE_SUBSYSTEM_NATIVE_WINDOWS": "Native Win9x driver",
     "IMAGE_SUBSYSTEM_WINDOWS_CE_GUI": "Windows CE",
     "IMAGE_SUBSYSTEM_EFI_APPLICATION": "Extensible Firmware Interface (EFI) application",
     "IMAGE_SUBSYSTEM_EFI_BOOT_SERVICE_DRIVER": "EFI driver with boot services",
@@ -238,4 +239,126 @@ windowssubsystem_descs = {
     "IMAGE_SUBSYSTEM_EFI_ROM": "An EFI ROM image",
     "IMAGE_SUBSYSTEM_XBOX": "XBOX",
     "IMAGE_SUBSYSTEM_WINDOWS_BOOT_APPLICATION": "Windows boot application",
-}
\ No newline at end of file
+}
+
+class ResourceType(IntEnum):
+    RT_CURSOR = 1
+    RT_BITMAP = 2
+    RT_ICON = 3
+    RT_MENU = 4
+    RT_DIALOG = 5
+    RT_STRING = 6
+    RT_FONTDIR = 7
+    RT_FONT = 8
+    RT_ACCELERATOR = 9
+    RT_RCDATA = 10
+    RT_MESSAGETABLE = 11
+    RT_GROUP_CURSOR = 12
+    RT_GROUP_ICON = 14
+    RT_VERSION = 16
+    RT_DLGINCLUDE = 17
+    RT_PLUGPLAY = 19
+    RT_VXD = 20
+    RT_ANICURSOR = 21
+    RT_ANIICON = 22
+    RT_HTML = 23
+    RT_MANIFEST = 24
+    
+    def desc(value):
+        return resourcetype_descs[value]
+
+resourcetype_descs = {
+    "RT_CURSOR": "Hardware-dependent cursor",
+    "RT_BITMAP": "Bitmap",
+    "RT_ICON": "Hardware-dependent icon",
+    "RT_MENU": "Menu",
+    "RT_DIALOG": "Dialog box",
+    "RT_STRING": "String-table entry",
+    "RT_FONTDIR": "Font directory",
+    "RT_FONT": "Font",
+    "RT_ACCELERATOR": "Accelerator table",
+    "RT_RCDATA": "Raw data",
+    "RT_MESSAGETABLE": "Message-table entry",
+    "RT_GROUP_CURSOR": "Hardware-independent cursor",
+    "RT_GROUP_ICON": "Hardware-independent icon",
+    "RT_VERSION": "Version",
+    "RT_DLGINCLUDE": "Header file name for a resource script",
+    "RT_PLUGPLAY": "Plug and Play",
+    "RT_VXD": "VXD",
+    "RT_ANICURSOR": "Animated cursor",
+    "RT_ANIICON": "Animated icon",
+    "RT_HTML": "HTML",
+    "RT_MANIFEST": "Side-by-Side Assembly Manifest",
+}
+
+class RelocationType(IntEnum):
+    IMAGE_REL_BASED_ABSOLUTE = 0
+    IMAGE_REL_BASED_HIGH = 1
+    IMAGE_REL_BASED_LOW = 2
+    IMAGE_REL_BASED_HIGHLOW = 3
+    IMAGE_REL_BASED_HIGHADJ = 4
+    IMAGE_REL_BASED_MIPS_JMPADDR = 5
+    IMAGE_REL_BASED_THUMB_MOV32 = 7
+    IMAGE_REL_BASED_RISCV_LOW12S = 8
+    IMAGE_REL_BASED_MIPS_JMPADDR16 = 9
+    IMAGE_REL_BASED_DIR64 = 10
+    
+    def desc(value):
+        return relocationtype_descs[value]
+
+relocationtype_descs = {
+    "IMAGE_REL_BASED_ABSOLUTE": "Padding, skipped",
+    "IMAGE_REL_BASED_HIGH": "High 16 bits of the difference",
+    "IMAGE_REL_BASED_LOW": "Low 16 bits of the difference",
+    "IMAGE_REL_BASED_HIGHLOW": "All 32 bits of the difference",
+    "IMAGE_REL_BASED_HIGHADJ": "High 16 bits, adjusted by the next entry",
+    "IMAGE_REL_BASED_MIPS_JMPADDR": "MIPS jump or ARM MOVW/MOVT",
+    "IMAGE_REL_BASED_THUMB_MOV32": "Thumb MOVW/MOVT",
+    "IMAGE_REL_BASED_RISCV_LOW12S": "RISC-V low 12 bits, S-type",
+    "IMAGE_REL_BASED_MIPS_JMPADDR16": "MIPS16 jump",
+    "IMAGE_REL_BASED_DIR64": "All 64 bits of the difference",
+}
+
+# Multi bit fields inside a Flag hold a number rather than independent bits
+FLAG_FIELDS = {SectionFlags: 0x00F00000}
+
+# Member value to name and to description, built once for every enum above
+NAMES = {}
+DESCRIPTIONS = {}
+for enum in (Characteristics, DLLCharacteristics, MachineType, SectionFlags, WindowsSubsystem, ResourceType, RelocationType):
+    # Iterating a Flag skips its multi bit members, __members__ has them all
+    members = enum.__members__.values()
+    NAMES[enum] = {member.value: member.name for member in members}
+    DESCRIPTIONS[enum] = {member.value: enum.desc(member.name) for member in members}
+
+@lru_cache(maxsize=4096)
+def decode(enum, value):
+    # (name, description) pairs for a raw value, in bit order for flags. Bits
+    # or values without a member come out as one explicit unknown pair instead
+    # of failing. Files of a corpus share a small set of values, so the cache
+    # turns decoding into a lookup.
+    names = NAMES[enum]
+    descriptions = DESCRIPTIONS[enum]
+    if not issubclass(enum, Flag):
+        if value in names:
+            return ((names[value], descriptions[value]),)
+        return ((hex(value), f"Unknown value {hex(value)}"),)
+    
+    field = FLAG_FIELDS.get(enum, 0)
+    parts = [value & field] if value & field else []
+    unknown = 0
+    rest = value & ~field
+    while rest:
+        bit = rest & -rest
+        parts.append(bit)
+        rest ^= bit
+    
+    pairs = []
+    for part in sorted(parts):
+        if part in names:
+            pairs.append((names[part], descriptions[part]))
+        else:
+            unknown |= part
+    if unknown:
+        pairs.append((hex(unknown), f"Unknown flags {hex(unknown)}"))
+    return tuple(pairs)
\ No newline at end of file
@@ -0,0 +1,680 @@
+import sys
+import heapq
+import struct
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+
+import definitions as defs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+IMPORT_DESCRIPTOR = struct.Struct("<IIIII")
+EXPORT_DIRECTORY = struct.Struct("<IIHHIIIIIII")
+RESOURCE_DIRECTORY = struct.Struct("<IIHHHH")
+RESOURCE_ENTRY = struct.Struct("<II")
+RESOURCE_DATA = struct.Struct("<IIII")
+VERSION_BLOCK = struct.Struct("<HHH")
+RELOCATION_BLOCK = struct.Struct("<II")
+
+# Maps the high byte of a relocation entry to its type
+HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+
+# Thunks are read a block at a time instead of one by one
+THUNKS32 = struct.Struct("<64I")
+THUNKS64 = struct.Struct("<64Q")
+# Names are read this many bytes at a time until their NUL, and never grow
+# past MAX_NAME, long as some mangled C++ names are
+NAME_CHUNK = 256
+MAX_NAME = 1 << 16
+
+class StringPool:
+    # Shares one str per distinct DLL or symbol name across every file a process parses
+    def __init__(self, limit=1 << 16):
+        self.limit = limit
+        self.strings = {}
+    
+    def get(self, raw):
+        s = self.strings.get(raw)
+        if s is None:
+            s = raw.decode("latin-1")
+            # Past the limit names are still decoded, just not kept around
+            if len(self.strings) < self.limit:
+                self.strings[raw] = s
+        return s
+
+POOL = StringPool()
+
+def unlimited(work=0):
+    # Default for the spend callback the parsers charge their reads to
+    pass
+
+@dataclass(frozen=True, slots=True)
+class ImportedFunction:
+    name: str | None
+    ordinal: int | None = None
+    hint: int = 0
+    
+    def __str__(self):
+        return self.name if self.name is not None else f"#{self.ordinal}"
+
+@dataclass(slots=True)
+class ImportedDLL:
+    name: str
+    functions: list
+    
+    def to_dict(self):
+        return {"dll": self.name, "functions": [str(function) for function in self.functions]}
+    
+    def __str__(self):
+        names = [str(function) for function in self.functions] or [""]
+        res = f"{self.name:>40} : {names[0]}\n"
+        for name in names[1:]:
+            res += " "*43 + name + "\n"
+        return res
+
+class SectionIndex:
+    # Disjoint, sorted RVA intervals, each mapped to the section that owns it.
+    # Overlapping sections are resolved like the loader maps them: in table
+    # order, so a later section wins wherever it overlaps an earlier one.
+    def __init__(self, sections, headers_size=0):
+        self.headers_size = headers_size
+        self.starts = []
+        self.ends = []
+        self.deltas = []
+        self.backed = []
+        self.owners = []
+        
+        # Raw data ranges in the file, sorted, for bounding reads that start in one
+        raw = sorted((pointer, pointer + raw_size) for _, _, pointer, raw_size in sections if raw_size)
+        self.raw_starts = [start for start, _ in raw]
+        self.raw_ends = [end for _, end in raw]
+        
+        events = []
+        for i, (address, virtual_size, pointer, raw_size) in enumerate(sections):
+            # A zero virtual size means the raw size is the size in memory too
+            size = virtual_size or raw_size
+            if size:
+                events.append((address, address + size, i, pointer, raw_size))
+        
+        events.sort()
+        bounds = sorted({bound for event in events for bound in event[:2]})
+        active = []
+        j = 0
+        
+        for lo, hi in zip(bounds, bounds[1:]):
+            while j < len(events) and events[j][0] <= lo:
+                address, end, i, pointer, raw_size = events[j]
+                heapq.heappush(active, (-i, end, address, pointer, raw_size))
+                j += 1
+            
+            while active and active[0][1] <= lo:
+                heapq.heappop(active)
+            
+            if not active:
+                continue
+            
+            i, _, address, pointer, raw_size = active[0]
+            if self.owners and self.owners[-1] == -i and self.ends[-1] == lo:
+                self.ends[-1] = hi
+                continue
+            
+            self.starts.append(lo)
+            self.ends.append(hi)
+            self.deltas.append(pointer - address)
+            # Past the raw data the section is zero filled and has no file offset
+            self.backed.append(address + raw_size)
+            self.owners.append(-i)
+    
+    def section(self, rva):
+        i = bisect_right(self.starts, rva) - 1
+        if i >= 0 and rva < self.ends[i]:
+            return i
+        return None
+    
+    def lookup(self, rva):
+        i = self.section(rva)
+        if i is not None:
+            return rva + self.deltas[i] if rva < self.backed[i] else None
+        
+        # Anything not in a section but below SizeOfHeaders is the headers, mapped as is
+        if 0 <= rva < self.headers_size:
+            return rva
+        return None
+    
+    def section_end(self, offset):
+        # End of the raw data, a section's or the headers', the file offset is in
+        i = bisect_right(self.raw_starts, offset) - 1
+        if i >= 0 and offset < self.raw_ends[i]:
+            return self.raw_ends[i]
+        if 0 <= offset < self.headers_size:
+            return self.headers_size
+        return None
+
+def read_string(content, offset, section_end=None, spend=unlimited):
+    # Up to the NUL terminator, but not past the end of the raw data the
+    # string starts in, which section_end(offset) tells when it is given
+    end = section_end(offset) if section_end is not None else None
+    end = min(len(content), offset + MAX_NAME, end if end is not None else len(content))
+    parts = []
+    while offset < end:
+        chunk = bytes(content[offset:min(offset + NAME_CHUNK, end)])
+        if not chunk:
+            break
+        spend(len(chunk))
+        head, nul, _ = chunk.partition(b"\x00")
+        parts.append(head)
+        if nul:
+            break
+        offset += len(chunk)
+    return b"".join(parts)
+
+def parse_imports(content, rva_to_offset, address, plus, pool=POOL, max_dlls=4096, max_functions=65536, max_total=1 << 18, spend=unlimited, section_end=None):
+    # max_functions caps a single DLL, max_total every DLL of the file together
+    dlls = []
+    offset = rva_to_offset(address)
+    if not address or offset is None:
+        return dlls
+    
+    for i in range(max_dlls):
+        if max_total <= 0:
+            break
+        spend(IMPORT_DESCRIPTOR.size)
+        data = content[offset + i * 20:offset + i * 20 + 20]
+        if len(data) < 20:
+            break
+        
+        lookup, _, _, name_rva, first_thunk = IMPORT_DESCRIPTOR.unpack(data)
+        if lookup == name_rva == first_thunk == 0:
+            break
+        
+        name_offset = rva_to_offset(name_rva)
+        name = pool.get(read_string(content, name_offset, section_end, spend)) if name_offset is not None else ""
+        
+        # Bound images overwrite the IAT, so prefer the lookup table when there is one
+        functions = parse_thunks(content, rva_to_offset, lookup or first_thunk, plus, pool, min(max_functions, max_total), spend, section_end)
+        max_total -= len(functions)
+        dlls.append(ImportedDLL(name, functions))
+    
+    return dlls
+
+def parse_thunks(content, rva_to_offset, address, plus, pool, max_functions, spend=unlimited, section_end=None):
+    functions = []
+    offset = rva_to_offset(address)
+    if offset is None:
+        return functions
+    
+    ordinal_flag = 1 << 63 if plus else 1 << 31
+    block = THUNKS64 if plus else THUNKS32
+    
+    while len(functions) < max_functions:
+        named = 0
+        data = content[offset:offset + block.size]
+        if len(data) < block.size:
+            # Tail of the file, pad it so the block still unpacks
+            data = bytes(data).ljust(block.size, b"\x00")
+        
+        for thunk in block.unpack_from(data):
+            if thunk == 0 or len(functions) >= max_functions:
+                spend(block.size + 2 * named)
+                return functions
+            
+            if thunk & ordinal_flag:
+                functions.append(ImportedFunction(None, thunk & 0xffff))
+                continue
+            
+            name_offset = rva_to_offset(thunk & 0x7fffffff)
+            if name_offset is None:
+                functions.append(ImportedFunction(None))
+                continue
+            
+            named += 1
+            hint = int.from_bytes(content[name_offset:name_offset + 2], "little")
+            functions.append(ImportedFunction(pool.get(read_string(content, name_offset + 2, section_end, spend)), hint=hint))
+        
+        # The block and the hints it pointed at, read_string charges the names
+        spend(block.size + 2 * named)
+        offset += block.size
+    
+    return functions
+
+@dataclass(frozen=True, slots=True)
+class ExportedFunction:
+    name: str | None
+    ordinal: int
+    address: int
+    forwarder: str | None = None
+    
+    def to_dict(self):
+        return {"name": self.name, "ordinal": self.ordinal, "address": self.address, "forwarder": self.forwarder}
+    
+    def __str__(self):
+        name = self.name if self.name is not None else f"#{self.ordinal}"
+        target = self.forwarder if self.forwarder is not None else hex(self.address)
+        return f"{name:>40} : {target}\n"
+
+def read_array(content, offset, code, count):
+    items = array(code)
+    if offset is None or count <= 0:
+        return items
+    
+    data = bytes(content[offset:offset + count * items.itemsize])
+    items.frombytes(data[:len(data) - len(data) % items.itemsize])
+    if sys.byteorder == "big":
+        items.byteswap()
+    return items
+
+class ExportDirectory:
+    # The three export tables stay packed in arrays, and lookups by name binary
+    # search the name pointer table, which the linker emits in sorted order
+    def __init__(self, content, rva_to_offset, address, size, pool=POOL, spend=unlimited, section_end=None):
+        self.content = content
+        self.rva_to_offset = rva_to_offset
+        self.address = address
+        self.size = size
+        self.pool = pool
+        self.spend = spend
+        self.section_end = section_end
+        self.name = ""
+        self.base = 0
+        self.tables = None
+        
+        offset = rva_to_offset(address) if address else None
+        data = content[offset:offset + EXPORT_DIRECTORY.size] if offset is not None else b""
+        if len(data) < EXPORT_DIRECTORY.size:
+            self.header = None
+            return
+        
+        self.header = EXPORT_DIRECTORY.unpack(data)
+        name_offset = rva_to_offset(self.header[4])
+        if name_offset is not None:
+            self.name = pool.get(read_string(content, name_offset, section_end, spend))
+        self.base = self.header[5]
+    
+    def load(self):
+        # The tables are only read on first use
+        if self.tables is None:
+            if self.header is None:
+                self.tables = (array("I"), array("I"), array("H"))
+            else:
+                _, _, _, _, _, _, functions, names, address_table, name_table, ordinal_table = self.header
+                tables = [
+                    (self.rva_to_offset(address_table), "I", functions),
+                    (self.rva_to_offset(name_table), "I", names),
+                    (self.rva_to_offset(ordinal_table), "H", names),
+                ]
+                # Charged for what the file holds, a corrupt header's counts can be anything
+                self.spend(sum(
+                    max(0, min(count * array(code).itemsize, len(self.content) - offset))
+                    for offset, code, count in tables if offset is not None
+                ))
+                self.tables = tuple(read_array(self.content, offset, code, count) for offset, code, count in tables)
+        return self.tables
+    
+    def name_at(self, i):
+        offset = self.rva_to_offset(self.load()[1][i])
+        return read_string(self.content, offset, self.section_end, self.spend) if offset is not None else b""
+    
+    def find(self, name):
+        target = name.encode("latin-1") if isinstance(name, str) else name
+        _, names, ordinals = self.load()
+        count = min(len(names), len(ordinals))
+        
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        if lo < count and self.name_at(lo) == target:
+            return self.export(ordinals[lo], self.pool.get(target))
+        return None
+    
+    def by_ordinal(self, ordinal):
+        index = ordinal - self.base
+        _, names, ordinals = self.load()
+        # Rare enough that one scan of the ordinal table beats keeping a reverse map
+        try:
+            i = ordinals.index(index, 0, min(len(names), len(ordinals)))
+        except ValueError:
+            return self.export(index)
+        return self.export(index, self.pool.get(self.name_at(i)))
+    
+    def export(self, index, name=None):
+        addresses = self.load()[0]
+        if not 0 <= index < len(addresses):
+            return None
+        
+        address = addresses[index]
+        forwarder = None
+        # Addresses inside the export directory itself point at "DLL.Function" strings
+        if self.address <= address < self.address + self.size:
+            offset = self.rva_to_offset(address)
+            if offset is not None:
+                forwarder = self.pool.get(read_string(self.content, offset, self.section_end, self.spend))
+        
+        return ExportedFunction(name, self.base + index, address, forwarder)
+    
+    def __len__(self):
+        return len(self.load()[0])
+    
+    def __iter__(self):
+        addresses, names, ordinals = self.load()
+        # Full enumeration needs every name anyway, so only here is a reverse map built
+        named = {}
+        for i in range(min(len(names), len(ordinals))):
+            named.setdefault(ordinals[i], i)
+        
+        for index in range(len(addresses)):
+            if addresses[index] == 0:
+                continue
+            name = self.pool.get(self.name_at(named[index])) if index in named else None
+            yield self.export(index, name)
+
+@dataclass(frozen=True, slots=True)
+class ResourceData:
+    path: tuple
+    rva: int
+    offset: int | None
+    size: int
+    codepage: int
+    
+    def to_dict(self):
+        return {"path": list(self.path), "rva": self.rva, "offset": self.offset, "size": self.size, "codepage": self.codepage}
+    
+    def __str__(self):
+        path = "/".join(str(part) for part in self.path)
+        return f"{path:>40} : {self.size} bytes at {hex(self.rva)}\n"
+
+@dataclass(frozen=True, slots=True)
+class VersionString:
+    key: str
+    value: str
+    
+    def to_dict(self):
+        return {"key": self.key, "value": self.value}
+    
+    def __str__(self):
+        return f"{self.key:>40} : {self.value}\n"
+
+class ResourceTree:
+    # Walks type/name/language directories lazily as the caller iterates. Every
+    # directory is visited at most once, so cyclic trees end instead of looping,
+    # and depth and entry budgets cap what a hostile tree can make us do.
+    def __init__(self, content, rva_to_offset, address, size, max_depth=8, max_entries=4096, spend=unlimited):
+        self.content = content
+        self.spend = spend
+        self.rva_to_offset = rva_to_offset
+        self.root = rva_to_offset(address) if address else None
+        self.size = size
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.errors = []
+    
+    def __iter__(self):
+        return self.walk()
+    
+    def walk(self):
+        self.visited = set()
+        self.count = 0
+        self.errors = []
+        if self.root is not None:
+            yield from self._walk(self.root, (), 0)
+    
+    def _walk(self, offset, path, depth):
+        if offset in self.visited:
+            self.errors.append(f"Directory at {hex(offset)} visited twice")
+            return
+        self.visited.add(offset)
+        
+        data = self.content[offset:offset + RESOURCE_DIRECTORY.size]
+        if len(data) < RESOURCE_DIRECTORY.size:
+            self.errors.append(f"Directory at {hex(offset)} is truncated")
+            return
+        
+        _, _, _, _, named, ids = RESOURCE_DIRECTORY.unpack(data)
+        for i in range(named + ids):
+            if self.count >= self.max_entries:
+                if "Entry limit reached" not in self.errors:
+                    self.errors.append("Entry limit reached")
+                return
+            self.count += 1
+            self.spend(RESOURCE_ENTRY.size)
+            
+            start = offset + RESOURCE_DIRECTORY.size + i * RESOURCE_ENTRY.size
+            data = self.content[start:start + RESOURCE_ENTRY.size]
+            if len(data) < RESOURCE_ENTRY.size:
+                self.errors.append(f"Entry at {hex(start)} is truncated")
+                return
+            
+            name, target = RESOURCE_ENTRY.unpack(data)
+            key = self.name(name, depth)
+            
+            if target & 0x80000000:
+                if depth + 1 >= self.max_depth:
+                    self.errors.append(f"Depth limit reached at {hex(start)}")
+                    continue
+                yield from self._walk(self.root + (target & 0x7fffffff), path + (key,), depth + 1)
+                continue
+            
+            data = self.content[self.root + target:self.root + target + RESOURCE_DATA.size]
+            if len(data) < RESOURCE_DATA.size:
+                self.errors.append(f"Data entry at {hex(self.root + target)} is truncated")
+                continue
+            
+            rva, size, codepage, _ = RESOURCE_DATA.unpack(data)
+            yield ResourceData(path + (key,), rva, self.rva_to_offset(rva), size, codepage)
+    
+    def name(self, name, depth):
+        if name & 0x80000000:
+            # Names are length prefixed UTF-16 strings relative to the root
+            offset = self.root + (name & 0x7fffffff)
+            length = int.from_bytes(self.content[offset:offset + 2], "little")
+            self.spend(2 + 2 * length)
+            return bytes(self.content[offset + 2:offset + 2 + 2 * length]).decode("utf-16-le", "replace")
+        
+        if depth == 0 and name in defs.ResourceType._value2member_map_:
+            return defs.ResourceType(name).name
+        return name
+    
+    def read(self, leaf):
+        # A view over the resource in the file, nothing is copied for mapped files.
+        # Release it when done, the file's map is only unmapped once it is.
+        if leaf.offset is None:
+            return memoryview(b"")
+        return self.content[leaf.offset:leaf.offset + leaf.size]
+    
+    def version_info(self, limit=1 << 16):
+        for leaf in self:
+            if leaf.path and leaf.path[0] == "RT_VERSION":
+                return parse_version(bytes(self.read(leaf)[:limit]))
+        return []
+
+def parse_version(data, max_blocks=1024):
+    strings = []
+    blocks = [(0, len(data), 0)]
+    
+    while blocks and max_blocks:
+        max_blocks -= 1
+        pos, end, depth = blocks.pop()
+        if pos + VERSION_BLOCK.size > end:
+            continue
+        
+        length, value_length, kind = VERSION_BLOCK.unpack_from(data, pos)
+        if length < VERSION_BLOCK.size:
+            continue
+        block_end = min(pos + length, end)
+        
+        key_end = pos + VERSION_BLOCK.size
+        while key_end + 1 < block_end and data[key_end:key_end + 2] != b"\x00\x00":
+            key_end += 2
+        key = data[pos + VERSION_BLOCK.size:key_end].decode("utf-16-le", "replace")
+        
+        value = (key_end + 2 + 3) & ~3
+        # Text values count UTF-16 characters, binary ones count bytes
+        value_size = value_length * 2 if kind == 1 else value_length
+        
+        if depth == 0 and value_size >= 52 and value + 52 <= block_end:
+            ms, ls = struct.unpack_from("<II", data, value + 8)
+            strings.append(VersionString("FixedFileVersion", f"{ms >> 16}.{ms & 0xffff}.{ls >> 16}.{ls & 0xffff}"))
+        elif depth == 3 and kind == 1:
+            text = data[value:min(value + value_size, block_end)].decode("utf-16-le", "replace")
+            strings.append(VersionString(key, text.rstrip("\x00")))
+        
+        # Siblings after this block, then its children (StringFileInfo -> StringTable -> String)
+        if block_end < end:
+            blocks.append(((block_end + 3) & ~3, end, depth))
+        if depth < 3:
+            blocks.append(((value + value_size + 3) & ~3, block_end, depth + 1))
+    
+    return strings
+
+
+@dataclass(frozen=True, slots=True)
+class RelocationCount:
+    type: int
+    count: int
+    
+    @property
+    def name(self):
+        try:
+            return defs.RelocationType(self.type).name
+        except ValueError:
+            return str(self.type)
+    
+    def to_dict(self):
+        return {"type": self.name, "count": self.count}
+    
+    def __str__(self):
+        return f"{self.name:>40} : {self.count}\n"
+
+class Relocations:
+    # Every block's entries end up in one array('H'), a type in the top four
+    # bits and an offset into the block's page in the rest, so counting and
+    # rebasing work on whole buffers instead of an object per entry
+    def __init__(self, content, rva_to_offset, address, size, max_entries=1 << 24, spend=unlimited):
+        self.pages = array("I")
+        self.starts = array("I")
+        self.entries = array("H")
+        
+        position = 0
+        while address and position + RELOCATION_BLOCK.size <= size and len(self.entries) < max_entries:
+            offset = rva_to_offset(address + position)
+            header = bytes(content[offset:offset + RELOCATION_BLOCK.size]) if offset is not None else b""
+            if len(header) < RELOCATION_BLOCK.size:
+                break
+            
+            page, block_size = RELOCATION_BLOCK.unpack(header)
+            if block_size < RELOCATION_BLOCK.size:
+                break
+            
+            count = min((block_size - RELOCATION_BLOCK.size) // 2, max_entries - len(self.entries))
+            spend(RELOCATION_BLOCK.size + 2 * count)
+            self.pages.append(page)
+            self.starts.append(len(self.entries))
+            self.entries += read_array(content, offset + RELOCATION_BLOCK.size, "H", count)
+            position += block_size
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __iter__(self):
+        for kind, count in enumerate(self.counts()):
+            if count:
+                yield RelocationCount(kind, count)
+    
+    def counts(self):
+        if np is not None:
+            return np.bincount(np.frombuffer(self.entries, dtype=np.uint16) >> 12, minlength=16).tolist()
+        
+        # The type is the top nibble of each entry's high byte
+        high = memoryview(self.entries).cast("B")[1 if sys.byteorder == "little" else 0::2]
+        types = bytes(high).translate(HIGH_NIBBLE)
+        return [types.count(kind) for kind in range(16)]
+    
+    def blocks(self):
+        ends = self.starts[1:] + array("I", [len(self.entries)])
+        return zip(self.pages, self.starts, ends)
+    
+    def targets(self, kind):
+        # RVAs the entries of one type fix up
+        if np is not None:
+            entries = np.frombuffer(self.entries, dtype=np.uint16)
+            lengths = np.diff(np.append(np.frombuffer(self.starts, dtype=np.uint32), len(entries)))
+            pages = np.repeat(np.frombuffer(self.pages, dtype=np.uint32).astype(np.int64), lengths)
+            selected = (entries >> 12) == kind
+            return pages[selected] + (entries[selected] & 0xfff)
+        
+        targets = array("Q")
+        for page, start, end in self.blocks():
+            for entry in self.entries[start:end]:
+                if entry >> 12 == kind:
+                    targets.append(page + (entry & 0xfff))
+        return targets
+    
+    def rebase(self, image, delta):
+        # Applies delta to every fixup of a mapped image, a writable buffer indexed
+        # by RVA. A target listed twice is fixed up twice, like the loader does.
+        # Fixups reaching past the image are skipped, their number is returned.
+        skipped = 0
+        for kind, size in ((defs.RelocationType.IMAGE_REL_BASED_DIR64, 8), (defs.RelocationType.IMAGE_REL_BASED_HIGHLOW, 4)):
+            targets = self.targets(kind)
+            if not len(targets):
+                continue
+            
+            mask = (1 << 8 * size) - 1
+            if np is not None:
+                inside = targets[targets + size <= len(image)]
+                skipped += len(targets) - len(inside)
+                if not (inside % size).any():
+                    words = np.frombuffer(image, dtype=f"<u{size}", count=len(image) // size)
+                    # Unlike words[...] += delta, add.at applies repeated indices every time
+                    np.add.at(words, inside // size, np.array(delta & mask, dtype=words.dtype))
+                    continue
+                targets = inside
+            
+            field = struct.Struct("<Q" if size == 8 else "<I")
+            for rva in targets:
+                rva = int(rva)
+                if rva + size > len(image):
+                    skipped += 1
+                    continue
+                field.pack_into(image, rva, (field.unpack_from(image, rva)[0] + delta) & mask)
+        
+        counts = self.counts()
+        if counts[defs.RelocationType.IMAGE_REL_BASED_HIGH] or counts[defs.RelocationType.IMAGE_REL_BASED_LOW] or counts[defs.RelocationType.IMAGE_REL_BASED_HIGHADJ]:
+            skipped += self.rebase_halves(image, delta)
+        return skipped
+    
+    def rebase_halves(self, image, delta):
+        # The 16 bit fixups of old 32 bit images, rare enough to do one at a time
+        half = struct.Struct("<H")
+        skipped = 0
+        for page, start, end in self.blocks():
+            i = start
+            while i < end:
+                kind, rva = self.entries[i] >> 12, page + (self.entries[i] & 0xfff)
+                if kind == defs.RelocationType.IMAGE_REL_BASED_HIGHADJ:
+                    # The next entry holds the low half of the value instead of a fixup
+                    i += 1
+                    if i >= end:
+                        break
+                if kind in (defs.RelocationType.IMAGE_REL_BASED_HIGH, defs.RelocationType.IMAGE_REL_BASED_LOW, defs.RelocationType.IMAGE_REL_BASED_HIGHADJ) and rva + 2 > len(image):
+                    skipped += 1
+                elif kind == defs.RelocationType.IMAGE_REL_BASED_HIGH:
+                    value = (half.unpack_from(image, rva)[0] << 16) + delta
+                    half.pack_into(image, rva, (value >> 16) & 0xffff)
+                elif kind == defs.RelocationType.IMAGE_REL_BASED_LOW:
+                    half.pack_into(image, rva, (half.unpack_from(image, rva)[0] + delta) & 0xffff)
+                elif kind == defs.RelocationType.IMAGE_REL_BASED_HIGHADJ:
+                    # The low half is signed, the loader adds it as a SHORT
+                    low = self.entries[i] - 0x10000 if self.entries[i] & 0x8000 else self.entries[i]
+                    value = (half.unpack_from(image, rva)[0] << 16) + low + delta + 0x8000
+                    half.pack_into(image, rva, (value >> 16) & 0xffff)
+                i += 1
+        return skipped
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import operator
+import argparse
+from enum import Enum
+from array import array
+
+import definitions as defs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Column, array typecode, and the header and field of a raw record it is filled from
+FILE_COLUMNS = [
+    ("machine", "H", "coff", "machine_type"),
+    ("characteristics", "H", "coff", "characteristics"),
+    ("timestamp", "I", "coff", "time_date_stamp"),
+    ("subsystem", "H", "optional", "subsystem"),
+    ("dll_characteristics", "H", "optional", "dll_characteristics"),
+    ("size_of_image", "I", "optional", "size_of_image"),
+    ("image_base", "Q", "optional", "image_base"),
+]
+
+SECTION_COLUMNS = [
+    ("flags", "I", "characteristics"),
+    ("virtual_size", "I", "virtual_size"),
+    ("raw_size", "I", "size_of_raw_data"),
+]
+
+ENUMS = {
+    "machine": defs.MachineType,
+    "characteristics": defs.Characteristics,
+    "subsystem": defs.WindowsSubsystem,
+    "dll_characteristics": defs.DLLCharacteristics,
+    "flags": defs.SectionFlags,
+}
+
+DTYPES = {"B": "<u1", "H": "<u2", "I": "<u4", "Q": "<u8"}
+
+# Swaps the 0 and 1 bytes of a pure Python mask
+INVERT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+def raw(value):
+    return value.value if isinstance(value, Enum) else value
+
+class IndexBuilder:
+    # Appends raw scan records to one array per column, written out on close
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.files = {name: array(code) for name, code, *_ in FILE_COLUMNS}
+        self.files["plus"] = array("B")
+        self.files["section_count"] = array("H")
+        self.sections = {name: array(code) for name, code, _ in SECTION_COLUMNS}
+        self.sections["file"] = array("I")
+        self.paths = open(os.path.join(directory, "paths.txt"), "w", encoding="utf-8", errors="surrogateescape")
+        self.rows = 0
+    
+    def add(self, record):
+        if "error" in record:
+            return
+        
+        for name, _, header, field in FILE_COLUMNS:
+            self.files[name].append(record[header].get(field) or 0)
+        self.files["plus"].append(record["format"] == "PE32+")
+        self.files["section_count"].append(len(record["sections"]))
+        
+        for section in record["sections"]:
+            for name, _, field in SECTION_COLUMNS:
+                self.sections[name].append(section[field])
+            self.sections["file"].append(self.rows)
+        
+        self.paths.write(record["path"] + "\n")
+        self.rows += 1
+    
+    def close(self):
+        self.paths.close()
+        for prefix, columns in (("file", self.files), ("section", self.sections)):
+            for name, data in columns.items():
+                with open(os.path.join(self.directory, f"{prefix}.{name}.{data.typecode}"), "wb") as f:
+                    data.tofile(f)
+        
+        meta = {"rows": self.rows, "sections": len(self.sections["file"]), "byteorder": sys.byteorder}
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+def load_column(path, code, count, byteorder):
+    if np is not None:
+        return np.fromfile(path, dtype=np.dtype(DTYPES[code]).newbyteorder(byteorder[0]), count=count)
+    
+    data = array(code)
+    with open(path, "rb") as f:
+        data.fromfile(f, count)
+    if byteorder != sys.byteorder:
+        data.byteswap()
+    return data
+
+class Mask:
+    # Row selection, a boolean array with numpy or a bytes object of 0s and 1s without
+    def __init__(self, bits):
+        self.bits = bits
+    
+    def combine(self, other, op):
+        if np is not None:
+            return Mask(op(self.bits, other.bits))
+        
+        # Big integers do the byte wise and/or in C
+        n = len(self.bits)
+        value = op(int.from_bytes(self.bits, "little"), int.from_bytes(other.bits, "little"))
+        return Mask(value.to_bytes(n, "little"))
+    
+    def __and__(self, other):
+        return self.combine(other, operator.and_)
+    
+    def __or__(self, other):
+        return self.combine(other, operator.or_)
+    
+    def __invert__(self):
+        if np is not None:
+            return Mask(~self.bits)
+        return Mask(self.bits.translate(INVERT))
+    
+    def __len__(self):
+        if np is not None:
+            return int(np.count_nonzero(self.bits))
+        return self.bits.count(1)
+    
+    def rows(self):
+        if np is not None:
+            return np.flatnonzero(self.bits).tolist()
+        return [i for i, bit in enumerate(self.bits) if bit]
+
+class Column:
+    def __init__(self, data):
+        self.data = data
+    
+    def compare(self, op, value):
+        value = raw(value)
+        if np is not None:
+            return Mask(op(self.data, value))
+        return Mask(bytes(op(v, value) for v in self.data))
+    
+    def __eq__(self, value):
+        return self.compare(operator.eq, value)
+    
+    def __ne__(self, value):
+        return self.compare(operator.ne, value)
+    
+    def __lt__(self, value):
+        return self.compare(operator.lt, value)
+    
+    def __le__(self, value):
+        return self.compare(operator.le, value)
+    
+    def __gt__(self, value):
+        return self.compare(operator.gt, value)
+    
+    def __ge__(self, value):
+        return self.compare(operator.ge, value)
+    
+    def has(self, flags):
+        # Every one of the flags is set
+        flags = raw(flags)
+        if np is not None:
+            return Mask((self.data & flags) == flags)
+        return Mask(bytes((v & flags) == flags for v in self.data))
+    
+    def any(self, flags):
+        flags = raw(flags)
+        if np is not None:
+            return Mask((self.data & flags) != 0)
+        return Mask(bytes((v & flags) != 0 for v in self.data))
+
+class Table:
+    def __init__(self, columns):
+        self.columns = columns
+    
+    def __getattr__(self, name):
+        try:
+            return Column(self.columns[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+class CorpusIndex(Table):
+    # Files are rows of the main table, sections rows of their own table that
+    # point back at their file, so per section predicates reduce to file masks
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        
+        self.directory = directory
+        self.rows = meta["rows"]
+        columns = {"file": {}, "section": {}}
+        for name in os.listdir(directory):
+            prefix, _, rest = name.partition(".")
+            if prefix in columns:
+                column, code = rest.rsplit(".", 1)
+                count = self.rows if prefix == "file" else meta["sections"]
+                columns[prefix][column] = load_column(os.path.join(directory, name), code, count, meta["byteorder"])
+        
+        super().__init__(columns["file"])
+        self.section = Table(columns["section"])
+        self._paths = None
+    
+    def with_section(self, mask):
+        # Files with at least one section in the section mask
+        files = self.section.columns["file"]
+        if np is not None:
+            bits = np.zeros(self.rows, dtype=bool)
+            bits[files[mask.bits]] = True
+            return Mask(bits)
+        
+        bits = bytearray(self.rows)
+        for file, bit in zip(files, mask.bits):
+            if bit:
+                bits[file] = 1
+        return Mask(bytes(bits))
+    
+    def paths(self, mask):
+        if self._paths is None:
+            with open(os.path.join(self.directory, "paths.txt"), encoding="utf-8", errors="surrogateescape") as f:
+                self._paths = f.read().splitlines()
+        return [self._paths[row] for row in mask.rows()]
+
+def parse_value(column, value):
+    # Enum member names, with or without their common prefix, joined with |, or a number
+    enum = ENUMS.get(column)
+    total = 0
+    for part in value.split("|"):
+        if part.isdigit() or part.startswith("0x"):
+            total |= int(part, 0)
+            continue
+        
+        members = [m for m in enum or () if m.name == part or m.name.endswith("_" + part)]
+        if not members:
+            raise ValueError(f"unknown {column} value {part}")
+        total |= members[0].value
+    return total
+
+def condition(index, text):
+    # column=value, column>value, column<value, column&flags or column!&flags,
+    # section.column&flags for files with a matching section
+    for op in ("!&", "&", ">=", "<=", "!=", "=", ">", "<"):
+        if op in text:
+            name, value = text.split(op, 1)
+            break
+    else:
+        raise ValueError(f"no operator in {text}")
+    
+    table = index
+    if name.startswith("section."):
+        table = index.section
+        name = name[len("section."):]
+    column = getattr(table, name)
+    value = parse_value(name, value)
+    
+    if op == "!&":
+        mask = ~column.has(value)
+    elif op == "&":
+        mask = column.has(value)
+    else:
+        ops = {">=": operator.ge, "<=": operator.le, "!=": operator.ne, "=": operator.eq, ">": operator.gt, "<": operator.lt}
+        mask = column.compare(ops[op], value)
+    
+    return index.with_section(mask) if table is not index else mask
+
+def main(args):
+    if args.command == "build":
+        with IndexBuilder(args.index) as builder:
+            for path in args.inputs:
+                with (sys.stdin if path == "-" else open(path)) as f:
+                    for line in f:
+                        if line.strip():
+                            builder.add(json.loads(line))
+        print(f"{builder.rows} files", file=sys.stderr)
+        return
+    
+    index = CorpusIndex(args.index)
+    start = time.perf_counter()
+    mask = None
+    for text in args.conditions:
+        part = condition(index, text)
+        mask = part if mask is None else mask & part
+    if mask is None:
+        mask = Mask(np.ones(index.rows, dtype=bool) if np is not None else b"\x01" * index.rows)
+    
+    for path in index.paths(mask):
+        print(path)
+    print(f"{len(mask)} of {index.rows} files in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar index of scanned headers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build an index from -f jsonl scans")
+    build.add_argument("index", help="index directory")
+    build.add_argument("inputs", nargs="+", help="JSON Lines scan results, - for stdin")
+    query = commands.add_parser("query", help="list the files matching every condition")
+    query.add_argument("index", help="index directory")
+    query.add_argument("conditions", nargs="*", help="e.g. machine=AMD64 characteristics&DLL dll_characteristics!&NX_COMPAT timestamp>1600000000 section.flags&MEM_EXECUTE|MEM_WRITE")
+    main(parser.parse_args())
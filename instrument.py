@@ -0,0 +1,136 @@
+import json
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds of the latency buckets in seconds, four per decade from 1us to 10s
+BUCKETS = tuple(10 ** (e / 4) for e in range(-24, 5))
+
+class Stage:
+    __slots__ = ("count", "seconds", "bytes", "buckets")
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+    
+    def quantile(self, q):
+        # Upper bound of the bucket the quantile falls in
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+    
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "seconds": self.seconds,
+            "bytes": self.bytes,
+            "buckets": self.buckets,
+            "mean": self.seconds / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+class Profiler:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+    
+    def record(self, name, seconds, nbytes=0):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage()
+        stage.count += 1
+        stage.seconds += seconds
+        stage.bytes += nbytes
+        stage.buckets[bisect_left(BUCKETS, seconds)] += 1
+    
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+    
+    def merge(self, data):
+        for name, values in data["stages"].items():
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = Stage()
+            stage.count += values["count"]
+            stage.seconds += values["seconds"]
+            stage.bytes += values["bytes"]
+            stage.buckets = [a + b for a, b in zip(stage.buckets, values["buckets"])]
+        
+        for name, n in data["counters"].items():
+            self.count(name, n)
+    
+    def to_dict(self):
+        return {
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+    
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+    
+    def to_prometheus(self, prefix="pe_examine"):
+        lines = [
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, stage in self.stages.items():
+            total = 0
+            for bound, n in zip(BUCKETS, stage.buckets):
+                total += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound:.6g}"}} {total}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage.seconds}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage.count}')
+        
+        lines.append(f"# TYPE {prefix}_stage_bytes_total counter")
+        for name, stage in self.stages.items():
+            lines.append(f'{prefix}_stage_bytes_total{{stage="{name}"}} {stage.bytes}')
+        
+        for name, n in self.counters.items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {n}")
+        
+        return "\n".join(lines) + "\n"
+
+# The profiler of this process, None unless profiling was asked for. The hooks
+# below check it first, so a disabled profiler costs a global lookup per stage.
+active = None
+
+def enable():
+    global active
+    if active is None:
+        active = Profiler()
+    return active
+
+def start():
+    return perf_counter() if active is not None else 0.0
+
+def lap(name, since, nbytes=0):
+    if active is None:
+        return 0.0
+    
+    now = perf_counter()
+    active.record(name, now - since, nbytes)
+    return now
+
+def count(name, n=1):
+    if active is not None:
+        active.count(name, n)
+
+def collect(worker, path):
+    # Pool workers can't share the parent's profiler, so each file's numbers
+    # travel back with its result and are merged there
+    global active
+    previous = active
+    active = Profiler()
+    try:
+        active.count("files")
+        return worker(path), active.to_dict()
+    finally:
+        active = previous
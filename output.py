@@ -0,0 +1,71 @@
+import sys
+import csv
+import json
+
+class Writer:
+    def __init__(self, f):
+        self.f = f
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def close(self):
+        self.f.flush()
+        if self.f is not sys.stdout:
+            self.f.close()
+
+class TextWriter(Writer):
+    def write(self, report):
+        print(report, file=self.f)
+    
+    def error(self, path, error):
+        print(f"{path}: {error}", file=sys.stderr)
+
+class JSONLinesWriter(Writer):
+    def write(self, record):
+        self.f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    
+    def error(self, path, error):
+        self.write({"path": path, "error": error})
+
+class CSVWriter(Writer):
+    def __init__(self, f, columns):
+        super().__init__(f)
+        self.csv = csv.DictWriter(f, columns, restval="", extrasaction="ignore")
+        self.csv.writeheader()
+    
+    def write(self, record):
+        self.csv.writerow(flatten(record))
+    
+    def error(self, path, error):
+        self.csv.writerow({"path": path, "error": error})
+
+def flatten(record, prefix=""):
+    row = {}
+    for key, value in record.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            row.update(flatten(value, name + "."))
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            # Decoded flags
+            row[name] = "|".join(value)
+        elif isinstance(value, list):
+            # Per-section tables don't fit in fixed columns, so they stay nested
+            row[name] = json.dumps(value, separators=(",", ":"))
+        else:
+            row[name] = value
+    
+    return row
+
+def writer(fmt, f, columns=None):
+    if fmt == "jsonl":
+        return JSONLinesWriter(f)
+    elif fmt == "csv":
+        return CSVWriter(f, columns)
+    elif fmt == "text":
+        return TextWriter(f)
+    
+    raise ValueError(f"Unknown output format {fmt}")
@@ -1,59 +1,239 @@
+import os
 import sys
+import stat
+import mmap
+import hashlib
+import struct
+import asyncio
+import argparse
 from pathlib import Path
 
 from dataclasses import dataclass
 from typing import Callable
-from enum import Enum
+from enum import Enum, Flag
 import inspect
 from datetime import datetime
-from copy import deepcopy
+from functools import partial
 
 import definitions as defs
+import batch
+import cache
+import aioscan
+import analysis
+import directories
+import validation
+import instrument
+import output
 
-@dataclass
+class MappedContent:
+    def __init__(self, f):
+        self._file = f
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+    
+    def __len__(self):
+        return len(self._map)
+    
+    def __getitem__(self, key):
+        # Slices are zero-copy views, only the touched pages get read in
+        return self._view[key]
+    
+    def chunks(self, offset, size, chunk_size=1 << 20):
+        end = min(offset + size, len(self._map))
+        while offset < end:
+            yield self._view[offset:min(offset + chunk_size, end)]
+            offset += chunk_size
+    
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # A caller still holds a view, e.g. from ResourceTree.read, so the
+            # map stays valid until that is gone and is closed when collected
+            pass
+        self._file.close()
+
+class StreamContent:
+    def __init__(self, f):
+        self._file = f
+        self._seekable = f.seekable()
+        self._buffer = bytearray()
+    
+    def __len__(self):
+        if self._seekable:
+            return self._file.seek(0, 2)
+        
+        self._fill(None)
+        return len(self._buffer)
+    
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        
+        start = key.start or 0
+        if self._seekable:
+            self._file.seek(start)
+            if key.stop is None:
+                return memoryview(self._file.read())
+            return memoryview(self._file.read(max(key.stop - start, 0)))
+        
+        # Pipes can't seek, so keep whatever has been read so far around
+        self._fill(key.stop)
+        return memoryview(bytes(self._buffer[start:key.stop]))
+    
+    def chunks(self, offset, size, chunk_size=1 << 20):
+        if not self._seekable:
+            for start in range(offset, offset + size, chunk_size):
+                chunk = self[start:min(start + chunk_size, offset + size)]
+                if not chunk:
+                    break
+                yield chunk
+            return
+        
+        # One buffer is reused for the whole range, callers mustn't hold on to chunks
+        view = memoryview(bytearray(chunk_size))
+        self._file.seek(offset)
+        while size > 0:
+            n = self._file.readinto(view[:min(chunk_size, size)])
+            if not n:
+                break
+            yield view[:n]
+            size -= n
+    
+    def _fill(self, stop):
+        while stop is None or len(self._buffer) < stop:
+            chunk = self._file.read(65536 if stop is None else stop - len(self._buffer))
+            if not chunk:
+                break
+            self._buffer += chunk
+    
+    def close(self):
+        if self._file is not sys.stdin.buffer:
+            self._file.close()
+
+# First read of the headers only mode, enough for the headers of almost every file
+HEADER_WINDOW = 4096
+HEADER_BUDGET = 1 << 22
+
+class PrefixContent:
+    # The first len(data) bytes of a file, reads past them come back short
+    def __init__(self, data, size=None):
+        self._view = memoryview(data)
+        self._size = len(data) if size is None else size
+    
+    def __len__(self):
+        return self._size
+    
+    def __getitem__(self, key):
+        return self._view[key]
+    
+    def chunks(self, offset, size, chunk_size=1 << 20):
+        end = min(offset + size, len(self._view))
+        while offset < end:
+            yield self._view[offset:min(offset + chunk_size, end)]
+            offset += chunk_size
+    
+    def close(self):
+        self._view.release()
+
+def open_content(value):
+    if str(value) == "-":
+        return StreamContent(sys.stdin.buffer)
+    
+    f = open(value, "rb")
+    try:
+        return MappedContent(f)
+    except (ValueError, OSError):
+        # Empty files, pipes and some special filesystems can't be mapped
+        return StreamContent(f)
+
+@dataclass(frozen=True, slots=True)
 class Field:
     name: str
     offset: int
     size: int
-    value: int | None = None
     format: Callable[[int],str] | Enum | None = None
     int: bool = True
     
-    @property
-    def value(self):
-        return self._value
-    
-    @value.setter
-    def value(self, v):
+    def render(self, v):
         if self.format is None:
-            self.fmt_value = v
+            return v
         elif inspect.isclass(self.format) and issubclass(self.format, Enum):
-            fmt = self.format(v).name
-            if "|" in fmt:
-                values = fmt.split("|")
-            else:
-               values = [fmt]
-            
-            res = ""
-            for i in range(len(values)):
-                res += self.format.desc(values[i])
-                if i != len(values) - 1:
-                    res += "\n" + " "*43
-            
-            self.fmt_value = res
+            pairs = defs.decode(self.format, v)
+            if not pairs:
+                # No flags set
+                return hex(v)
+            return ("\n" + " "*43).join(desc for _, desc in pairs)
         elif callable(self.format):
-            self.fmt_value = self.format(v)
+            return self.format(v)
+    
+    def decode(self, v):
+        # Machine readable counterpart of render, used by the structured outputs
+        if not self.int:
+            return v.rstrip(b"\x00").decode("latin-1")
+        elif inspect.isclass(self.format) and issubclass(self.format, Enum):
+            names = [name for name, _ in defs.decode(self.format, v)]
+            if issubclass(self.format, Flag):
+                return names
+            return names[0]
+        elif callable(self.format):
+            return self.format(v)
         
-        self._value = v
+        return v
+
+class Value:
+    # Per-header record pairing a shared Field definition with a decoded value
+    __slots__ = ("field", "value", "_fmt_value")
+    
+    def __init__(self, field, value):
+        self.field = field
+        self.value = value
+        self._fmt_value = None
+    
+    @property
+    def fmt_value(self):
+        # Formatting only happens once something actually renders the value
+        if self._fmt_value is None:
+            self._fmt_value = self.field.render(self.value)
+        return self._fmt_value
     
     def __str__(self):
-        return f"{self.name:>40} : {self.fmt_value}"
+        return f"{self.field.name:>40} : {self.fmt_value}"
+
+class FieldTable(tuple):
+    # Little endian struct codes for the integer widths used by the PE format
+    codes = {1: "B", 2: "H", 4: "I", 8: "Q"}
     
-    def __add__(self, other):
-        self.offset += other
+    def __new__(cls, fields):
+        table = super().__new__(cls, fields)
+        table.compile()
+        return table
     
-    def __sub__(self, other):
-        self.offset -= other
+    def compile(self):
+        fmt = "<"
+        end = 0
+        self.names = {}
+        
+        for i, field in enumerate(self):
+            if field.offset < end:
+                raise ValueError(f"{field.name} overlaps the previous field")
+            
+            if field.offset > end:
+                fmt += f"{field.offset - end}x"
+            
+            fmt += self.codes[field.size] if field.int else f"{field.size}s"
+            end = field.offset + field.size
+            self.names[format_name(field.name)] = i
+        
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+def format_name(name):
+    return name.lower().replace(" ", "_")
+
+def raw_value(value):
+    return value.hex() if isinstance(value, bytes) else value
 
 class Header:
     def __init__(self, name, fields, start, content):
@@ -70,12 +250,15 @@ class Header:
     
     @fields.setter
     def fields(self, value):
-        if not isinstance(value, list):
+        if not isinstance(value, (list, tuple)):
             raise TypeError
         
         if not all([isinstance(item, Field) for item in value]):
             raise TypeError
         
+        if not isinstance(value, FieldTable):
+            value = FieldTable(value)
+        
         self._fields = value
     
     @property
@@ -88,30 +271,48 @@ class Header:
         self.populate_fields()
     
     def populate_fields(self):
-        fields = [field + self.start for field in self.fields]
+        self.end = self.start + self.fields.size
         
-        for field in self.fields:
-            if field.int:
-                field.value = int.from_bytes(self.content[field.offset:field.offset + field.size], 'little')
-            else:
-                field.value = self.content[field.offset:field.offset + field.size]
-            
-            setattr(self, self.format_name(field.name), field.value)
-            
-            if field.offset + field.size > self.end:
-                self.end = field.offset + field.size
+        data = self.content[self.start:self.end]
+        if len(data) < self.fields.size:
+            # Truncated files decode the missing bytes as zeros
+            data = bytes(data).ljust(self.fields.size, b"\x00")
+        
+        self.values = self.fields.struct.unpack_from(data)
+        self._records = None
     
-    def reverse_fields(self):
-        fields = [field - self.start for field in self.fields]
+    def __getattr__(self, name):
+        # Field values are looked up on demand instead of being set up front
+        if name.startswith("_") or "values" not in self.__dict__:
+            raise AttributeError(name)
+        
+        try:
+            return self.values[self.fields.names[name]]
+        except KeyError:
+            raise AttributeError(name) from None
+    
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = [Value(field, value) for field, value in zip(self.fields, self.values)]
+        return self._records
+    
+    def offset_of(self, name):
+        return self.start + self.fields[self.fields.names[name]].offset
+    
+    def to_dict(self, decoded=False):
+        if decoded:
+            return {format_name(r.field.name): r.field.decode(r.value) for r in self.records}
+        
+        return {name: raw_value(value) for name, value in zip(self.fields.names, self.values)}
     
     def format_name(self, name):
-        name = name.lower().replace(" ", "_")
-        return name
+        return format_name(name)
     
     def __str__(self):
         if self.name is None:
             if hasattr(self, "header_name"):
-                name = self.header_name.replace(b'\x00', b'').decode('utf-8')
+                name = self.header_name.replace(b'\x00', b'').decode('utf-8', 'replace')
             else:
                 raise ValueError
         else:
@@ -119,38 +320,70 @@ class Header:
         res = "="*20 + f" {name} " + "="*20
         res = f"{res:^80}\n"
         
-        for field in self.fields:
-            res += str(field) + "\n"
+        for record in self.records:
+            res += str(record) + "\n"
         
         return res
 
 class Executable:
-    def __init__(self, filename):
-        self.filename = filename
+    def __init__(self, filename, content=None, limits=None):
+        t = instrument.start()
+        if content is None:
+            self.filename = filename
+            t = instrument.lap("open", t)
+        else:
+            self._filename = Path(filename)
+            self.content = content
+        
+        self.validator = validation.Validator(limits)
+        self.limits = self.validator.limits
+        length = len(self.content)
+        
         self.DOS = Header("MS-DOS Stub", DOSHEADER, 0, self.content)
+        if self.validator.check_range("truncated", 0, DOSHEADER.size, length, "MS-DOS Stub") and self.DOS.magic_number != b"MZ":
+            self.validator.report("bad-magic", f"MS-DOS magic is {self.DOS.magic_number.hex()}", "MS-DOS Stub")
+        t = instrument.lap("dos", t)
+        
         self.COFF = Header("COFF File Header", COFFHEADER, self.DOS.pe_header_address, self.content)
+        if self.validator.check_range("out-of-bounds", self.COFF.start, COFFHEADER.size, length, "COFF File Header") and self.COFF.signature != b"PE\x00\x00":
+            self.validator.report("bad-signature", f"PE signature is {self.COFF.signature.hex()}", "COFF File Header")
+        t = instrument.lap("coff", t)
         
         # Not a great solution, but it works
         Optional = Header("PE32 Header", PE32HEADER, self.COFF.end, self.content)
-        if Optional.magic_number == b"\x0b\x01":
-            self.Optional = Optional
-            self.Data_dirs = Header("PE32 Data Directories", PE32DATADIRECTORIES, self.COFF.end, self.content)
-        elif Optional.magic_number == b"\x0b\x02":
-            Optional.reverse_fields()
+        if Optional.magic_number == b"\x0b\x02":
+            self.pe_format = "PE32+"
             self.Optional = Header("PE32+ Header", PE32PLUSHEADER, self.COFF.end, self.content)
             self.Data_dirs = Header("PE32+ Data Directories", PE32PLUSDATADIRECTORIES, self.COFF.end, self.content)
-                
-        section_table = []
+        else:
+            if Optional.magic_number != b"\x0b\x01":
+                # Decoded with the PE32 layout anyway, so there is something to look at
+                self.validator.report("bad-magic", f"unknown optional header magic {Optional.magic_number.hex()}", "PE32 Header")
+            self.pe_format = "PE32" if Optional.magic_number == b"\x0b\x01" else None
+            self.Optional = Optional
+            self.Data_dirs = Header("PE32 Data Directories", PE32DATADIRECTORIES, self.COFF.end, self.content)
+        self.validator.check_range("out-of-bounds", self.COFF.end, self.COFF.optional_header_size, length, self.Optional.name)
+        t = instrument.lap("optional", t)
+        
+        count = self.COFF.number_of_sections
+        if count > self.limits.max_sections:
+            self.validator.report("too-many-sections", f"{count} sections, only the first {self.limits.max_sections} are read", "Section Table")
+            count = self.limits.max_sections
+        
         start = self.COFF.end + self.COFF.optional_header_size
+        if not self.validator.check_range("out-of-bounds", start, SECTIONHEADERS.size * count, length, "Section Table"):
+            count = max(0, min(count, (length - start) // SECTIONHEADERS.size))
         
-        # Deepcopy is a hacky kind of workaround
-        header_defs = deepcopy(SECTIONHEADERS)
-        for section in range(self.COFF.number_of_sections):
-            header = Header(None, header_defs, start, self.content)
+        section_table = []
+        for section in range(count):
+            header = Header(None, SECTIONHEADERS, start, self.content)
+            name = header.header_name.rstrip(b"\x00").decode("latin-1")
+            self.validator.check_range("out-of-bounds", header.pointer_to_raw_data, header.size_of_raw_data, length, name)
             section_table.append(header)
             start = header.end
-            header_defs = deepcopy(SECTIONHEADERS)
         
+        self.sections = section_table
+        instrument.lap("sections", t)
         self.headers = [
             self.DOS,
             self.COFF,
@@ -159,6 +392,170 @@ class Executable:
         ]
         
         self.headers += section_table
+        self._section_index = None
+        self._imports = None
+        self._exports = None
+        self._section_analysis = None
+        self._verification = None
+        self._resources = None
+        self._relocations = None
+        self._analyses = {}
+    
+    @property
+    def anomalies(self):
+        return self.validator.anomalies
+    
+    def analyse(self, name):
+        # Whatever goes wrong in an analysis becomes an anomaly, not an error for the whole file
+        if name not in self._analyses:
+            t = instrument.start()
+            work = self.validator.work
+            self._analyses[name] = self.validator.guard(name, lambda: list(getattr(self, name)), [])
+            instrument.lap(name, t, self.validator.work - work)
+        return self._analyses[name]
+    
+    @property
+    def section_index(self):
+        # Built once and shared by every directory parser
+        if self._section_index is None:
+            self._section_index = directories.SectionIndex(
+                [
+                    (s.virtual_address, s.virtual_size, s.pointer_to_raw_data, s.size_of_raw_data)
+                    for s in self.sections
+                ],
+                self.Optional.size_of_headers,
+            )
+        return self._section_index
+    
+    def rva_to_offset(self, rva):
+        return self.section_index.lookup(rva)
+    
+    @property
+    def imports(self):
+        if self._imports is None:
+            self._imports = directories.parse_imports(
+                self.content,
+                self.rva_to_offset,
+                self.Data_dirs.import_table_address,
+                self.pe_format == "PE32+",
+                max_dlls=self.limits.max_dlls,
+                max_functions=self.limits.max_functions,
+                max_total=self.limits.max_imports,
+                spend=self.validator.spend,
+                section_end=self.section_index.section_end,
+            )
+            if sum(len(dll.functions) for dll in self._imports) >= self.limits.max_imports:
+                self.validator.report("too-many-imports", f"only the first {self.limits.max_imports} imported functions are read", "imports")
+        return self._imports
+    
+    @property
+    def imphash(self):
+        return analysis.imphash(self.analyse("imports"))
+    
+    @property
+    def section_analysis(self):
+        if self._section_analysis is None:
+            results = []
+            for section in self.sections:
+                # Only what is actually in the file gets read, whatever the header claims
+                self.validator.spend(max(0, min(section.size_of_raw_data, len(self.content) - section.pointer_to_raw_data)))
+                results.append(analysis.analyse_section(
+                    self.content,
+                    section.header_name.rstrip(b"\x00").decode("latin-1"),
+                    section.pointer_to_raw_data,
+                    section.size_of_raw_data,
+                ))
+            self._section_analysis = results
+        return self._section_analysis
+    
+    @property
+    def verification(self):
+        if self._verification is None:
+            self.validator.spend(len(self.content))
+            self._verification = [
+                analysis.verify(
+                    self.content,
+                    self.Optional.offset_of("checksum"),
+                    self.Data_dirs.offset_of("certificate_table_address"),
+                    # Unlike the other directories this one holds a file offset, not an RVA
+                    self.Data_dirs.certificate_table_address,
+                    self.Data_dirs.certificate_table_size,
+                )
+            ]
+        return self._verification
+    
+    @property
+    def resources(self):
+        if self._resources is None:
+            self._resources = directories.ResourceTree(
+                self.content,
+                self.rva_to_offset,
+                self.Data_dirs.resource_table_address,
+                self.Data_dirs.resource_table_size,
+                self.limits.max_resource_depth,
+                self.limits.max_resource_entries,
+                spend=self.validator.spend,
+            )
+        return self._resources
+    
+    @property
+    def version_info(self):
+        return self.resources.version_info()
+    
+    @property
+    def exports(self):
+        if self._exports is None:
+            self._exports = directories.ExportDirectory(
+                self.content,
+                self.rva_to_offset,
+                self.Data_dirs.export_table_address,
+                self.Data_dirs.export_table_size,
+                spend=self.validator.spend,
+                section_end=self.section_index.section_end,
+            )
+        return self._exports
+    
+    @property
+    def relocations(self):
+        if self._relocations is None:
+            self._relocations = directories.Relocations(
+                self.content,
+                self.rva_to_offset,
+                self.Data_dirs.base_relocation_table_address,
+                self.Data_dirs.base_relocation_table_size,
+                spend=self.validator.spend,
+            )
+        return self._relocations
+    
+    def image(self):
+        # The file laid out the way the loader maps it, for rebasing and reads by RVA.
+        # Only as far as the headers and sections reach, SizeOfImage is just a claim
+        alignment = max(self.Optional.section_alignment, 1)
+        extent = self.Optional.size_of_headers
+        for section in self.sections:
+            extent = max(extent, section.virtual_address + max(section.virtual_size, section.size_of_raw_data))
+        extent = -(-extent // alignment) * alignment
+        
+        size = self.Optional.size_of_image
+        if size > extent:
+            self.validator.report("image-too-large", f"SizeOfImage is {hex(size)}, the sections end at {hex(extent)}", self.Optional.name)
+            size = extent
+        if size > self.limits.max_image:
+            self.validator.report("image-too-large", f"only the first {self.limits.max_image} bytes of the image are mapped", self.Optional.name)
+            size = self.limits.max_image
+        
+        self.validator.spend(size)
+        image = bytearray(size)
+        headers = self.content[:min(self.Optional.size_of_headers, len(image))]
+        image[:len(headers)] = headers
+        
+        for section in self.sections:
+            size = min(section.size_of_raw_data, section.virtual_size or section.size_of_raw_data)
+            size = max(0, min(size, len(image) - section.virtual_address))
+            data = self.content[section.pointer_to_raw_data:section.pointer_to_raw_data + size]
+            image[section.virtual_address:section.virtual_address + len(data)] = data
+        
+        return image
     
     @property
     def filename(self):
@@ -168,28 +565,89 @@ class Executable:
     def filename(self, value):
         path = Path(value)
         
-        if not path.exists():
+        if str(value) != "-" and not path.exists():
             raise FileNotFoundError
         
         self._filename = path
+        self.content = open_content(value)
+    
+    def close(self):
+        self.content.close()
+    
+    def to_record(self, decoded=False, analyses=()):
+        t = instrument.start()
+        record = {
+            "path": str(self.filename),
+            "format": self.pe_format,
+            "dos": self.DOS.to_dict(),
+            "coff": self.COFF.to_dict(),
+            "optional": self.Optional.to_dict(),
+            "data_directories": self.Data_dirs.to_dict(),
+            "sections": [section.to_dict() for section in self.sections],
+        }
         
-        with open(value, "rb") as f:
-            self.content = f.read()
+        if decoded:
+            record["decoded"] = {
+                "dos": self.DOS.to_dict(True),
+                "coff": self.COFF.to_dict(True),
+                "optional": self.Optional.to_dict(True),
+                "data_directories": self.Data_dirs.to_dict(True),
+                "sections": [section.to_dict(True) for section in self.sections],
+            }
+        instrument.lap("record", t)
+        
+        for name in analyses:
+            record[name] = [item.to_dict() for item in self.analyse(name)]
+        
+        if "imports" in analyses:
+            record["imphash"] = self.imphash
+        
+        record["anomalies"] = [anomaly.to_dict() for anomaly in self.anomalies]
+        return record
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
     
     def __str__(self):
+        return self.render()
+    
+    def render(self, analyses=()):
+        t = instrument.start()
         res = "-"*20 + f" {self.filename.name.upper()} " + "-"*20
         res = f"{res:^80}\n"
         
         for header in self.headers:
             res += str(header) + "\n"
+        instrument.lap("render", t)
+        
+        for name in analyses:
+            title = "="*20 + f" {name.replace('_', ' ').upper()} " + "="*20
+            res += f"{title:^80}\n"
+            for item in self.analyse(name):
+                res += str(item)
+            
+            if name == "imports":
+                res += f"{'Imphash':>40} : {self.imphash}\n"
+            res += "\n"
+        
+        if self.anomalies:
+            title = "="*20 + " ANOMALIES " + "="*20
+            res += f"{title:^80}\n"
+            for anomaly in self.anomalies:
+                res += str(anomaly)
+            res += "\n"
         
         return res
 
 def bytes_str(s):
-    labels = ["B", "KB", "MB", "GB"]
+    labels = ["B", "KB", "MB", "GB", "TB", "PB", "EB"]
     
     counter = 0
-    while s >= 1024:
+    # 64 bit fields go up to 16 EB, but stop at the last label regardless
+    while s >= 1024 and counter < len(labels) - 1:
         s /= 1024
         counter += 1
     return f"{s:.02f} {labels[counter]}"
@@ -204,12 +662,12 @@ def bytes_str(s):
     return str(s) + " bytes"
     """
     
-DOSHEADER = [
+DOSHEADER = FieldTable([
     Field("Magic Number", 0, 2, int=False),
     Field("PE Header Address", 0x3c, 4, format=hex), 
-]
+])
 
-COFFHEADER = [
+COFFHEADER = FieldTable([
     Field("Signature", 0, 4, int=False),
     Field("Machine Type", 4, 2, format=defs.MachineType),
     Field("Number of Sections", 6, 2),
@@ -218,7 +676,7 @@ COFFHEADER = [
     Field("Number of Symbols", 16, 4),
     Field("Optional Header Size", 20, 2, format=bytes_str),
     Field("Characteristics", 22, 2, format=defs.Characteristics)
-]
+])
 
 COFFOPTIONALUNCHANGED = [
     Field("Magic Number", 0, 2, int=False),
@@ -248,7 +706,7 @@ COFFOPTIONALUNCHANGED2 = [
     Field("DLL Characteristics", 70, 2, format=defs.DLLCharacteristics),
 ]
 
-PE32HEADER = [
+PE32HEADER = FieldTable([
     *COFFOPTIONALUNCHANGED,
     Field("Base of Data", 24, 4, format=hex),
     Field("Image Base", 28, 4, format=hex),
@@ -259,9 +717,9 @@ PE32HEADER = [
     Field("Size of Heap Commit", 84, 4, format=bytes_str),
     Field("Loader Flags", 88, 4),
     Field("Number of RVA and Sizes", 92, 4),
-]
+])
 
-PE32DATADIRECTORIES = [
+PE32DATADIRECTORIES = FieldTable([
     Field("Export Table Address", 96, 4, format=hex),
     Field("Export Table Size", 100, 4, format=bytes_str),
     Field("Import Table Address", 104, 4, format=hex),
@@ -290,9 +748,9 @@ PE32DATADIRECTORIES = [
     Field("Delay Import Descriptor Size", 204, 4, format=bytes_str),
     Field("CLR Runtime Header Address", 208, 4, format=hex),
     Field("CLR Runtime Header Size", 212, 4, format=bytes_str),
-]
+])
 
-PE32PLUSHEADER = [
+PE32PLUSHEADER = FieldTable([
     *COFFOPTIONALUNCHANGED,
     Field("Image Base", 24, 8, format=hex),
     *COFFOPTIONALUNCHANGED2,
@@ -302,9 +760,9 @@ PE32PLUSHEADER = [
     Field("Size of Heap Commit", 96, 8, format=bytes_str),
     Field("Loader Flags", 104, 4),
     Field("Number of RVA and Sizes", 108, 4),
-]
+])
 
-PE32PLUSDATADIRECTORIES = [
+PE32PLUSDATADIRECTORIES = FieldTable([
     Field("Export Table Address", 112, 4, format=hex),
     Field("Export Table Size", 116, 4, format=bytes_str),
     Field("Import Table Address", 120, 4, format=hex),
@@ -333,9 +791,9 @@ PE32PLUSDATADIRECTORIES = [
     Field("Delay Import Descriptor Size", 220, 4, format=bytes_str),
     Field("CLR Runtime Header Address", 224, 4, format=hex),
     Field("CLR Runtime Header Size", 228, 4, format=bytes_str),
-]
+])
 
-SECTIONHEADERS = [
+SECTIONHEADERS = FieldTable([
     Field("Header Name", 0, 8, int=False),
     Field("Virtual Size", 8, 4, format=bytes_str),
     Field("Virtual Address", 12, 4, format=hex),
@@ -346,15 +804,262 @@ SECTIONHEADERS = [
     Field("Number of Relocations", 32, 2),
     Field("Number of Linenumbers", 34, 2),
     Field("Characteristics", 36, 4, format=defs.SectionFlags),
-]
+])
+
+def open_executable(path, analyses=(), limits=None):
+    # Only the analyses need more than the headers
+    if analyses or path == "-":
+        return Executable(path, limits=limits)
+    return Executable(path, read_headers(path, max_sections=(limits or validation.LIMITS).max_sections), limits)
+
+def report(path, analyses=(), limits=None):
+    with open_executable(path, analyses, limits) as exe:
+        return exe.render(analyses)
+
+def record(path, analyses=(), limits=None, digest=False):
+    with open_executable(path, analyses, limits) as exe:
+        res = exe.to_record(decoded=True, analyses=analyses)
+    
+    if digest and path != "-":
+        res["sha256"] = cache.file_digest(path)
+    return res
+
+def headers_size(content, max_sections=validation.LIMITS.max_sections):
+    # How much of the file the DOS, COFF and optional headers and the section table span
+    dos = Header("MS-DOS Stub", DOSHEADER, 0, content)
+    coff = Header("COFF File Header", COFFHEADER, dos.pe_header_address, content)
+    sections = coff.end + coff.optional_header_size
+    count = min(coff.number_of_sections, max_sections)
+    
+    return max(coff.end + PE32PLUSDATADIRECTORIES.size, sections + SECTIONHEADERS.size * count)
+
+def read_headers(path, window=HEADER_WINDOW, budget=HEADER_BUDGET, max_sections=validation.LIMITS.max_sections):
+    t = instrument.start()
+    f = open(path, "rb")
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        # Pipes and devices have no size to plan reads by, and a pipe can only
+        # be read once, so it is streamed from the file already open
+        instrument.lap("read", t)
+        return StreamContent(f)
+    
+    with f:
+        size = st.st_size
+        data = f.read(min(window, size))
+        
+        # Each extra read can reveal more of the headers, a few rounds always settle it
+        for _ in range(4):
+            needed = min(headers_size(PrefixContent(data), max_sections), size)
+            if needed <= len(data):
+                break
+            if needed > budget:
+                # Headers this spread out are mapped instead, which reads only the pages they touch
+                instrument.lap("read", t, len(data))
+                return open_content(path)
+            data += f.read(needed - len(data))
+    
+    instrument.lap("read", t, len(data))
+    return PrefixContent(data, size)
+
+def parse_prefix(path, data, size, limits=None):
+    return Executable(path, content=PrefixContent(data, size), limits=limits)
+
+def async_scanner(max_reads=32, limits=None, **kwargs):
+    limits = limits or validation.LIMITS
+    kwargs = {"window": HEADER_WINDOW, "budget": HEADER_BUDGET, "fallback": partial(Executable, limits=limits), **kwargs}
+    return aioscan.AsyncScanner(
+        partial(parse_prefix, limits=limits),
+        lambda data: headers_size(PrefixContent(data), limits.max_sections),
+        max_reads,
+        **kwargs,
+    )
+
+async def parse_async(path, scanner=None):
+    scanner = scanner or async_scanner()
+    return await scanner.parse(path)
+
+async def scan_async(paths, max_reads, writer, fmt, limits=None):
+    scanner = async_scanner(max_reads, limits)
+    try:
+        async for result in scanner.scan(paths):
+            instrument.count("files")
+            if result.error is not None:
+                instrument.count("errors")
+                writer.error(result.path, result.error)
+                continue
+            
+            # Fallbacks hold a map of the whole file until closed
+            with result.value as exe:
+                writer.write(exe.render() if fmt == "text" else exe.to_record(decoded=True))
+    finally:
+        scanner.close()
+
+def cached_record(cache_path, analyses, limits, path):
+    st = os.stat(path)
+    digest = cache.file_digest(path)
+    
+    # Copies and renames of a known file are still a hit on their content hash
+    res = cache.lookup_hash(cache_path, digest, str(path))
+    if res is None:
+        res = record(path, analyses, limits)
+    res["sha256"] = digest
+    
+    return st.st_size, st.st_mtime_ns, digest, res
+
+def uncached(paths, results, writer):
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            yield path
+            continue
+        
+        res = results.get(path, st.st_size, st.st_mtime_ns)
+        if res is None:
+            yield path
+        else:
+            writer.write(res)
+
+def schema_version():
+    # Changes whenever a field definition or one of the enums it decodes with does
+    digest = hashlib.sha256()
+    tables = [DOSHEADER, COFFHEADER, PE32HEADER, PE32DATADIRECTORIES, PE32PLUSHEADER, PE32PLUSDATADIRECTORIES, SECTIONHEADERS]
+    
+    for table in tables:
+        for field in table:
+            fmt = getattr(field.format, "__name__", None)
+            if inspect.isclass(field.format) and issubclass(field.format, Enum):
+                fmt = [fmt] + [(m.name, m.value) for m in field.format]
+            digest.update(repr((field.name, field.offset, field.size, field.int, fmt)).encode())
+    
+    return digest.hexdigest()
 
-def main(fn):
-    exe = Executable(fn)
+def record_columns(analyses=()):
+    columns = ["path", "format", "error"]
+    tables = {
+        "dos": [DOSHEADER],
+        "coff": [COFFHEADER],
+        "optional": [PE32HEADER, PE32PLUSHEADER],
+        "data_directories": [PE32DATADIRECTORIES],
+    }
+    
+    for key, fields in tables.items():
+        for table in fields:
+            for name in table.names:
+                if f"{key}.{name}" not in columns:
+                    columns += [f"{key}.{name}", f"decoded.{key}.{name}"]
     
-    print(exe)
+    columns += ["sections", "decoded.sections"]
+    # Analysis tables are nested like the sections, one column each
+    columns += list(analyses)
+    if "imports" in analyses:
+        columns.append("imphash")
+    return columns + ["anomalies", "sha256"]
+
+def main(args):
+    if args.output is None:
+        out = sys.stdout
+    else:
+        out = open(args.output, "w", newline="")
+    
+    analyses = tuple(args.analyses or ())
+    limits = validation.Limits(
+        max_sections=args.max_sections,
+        max_work=args.work_limit << 20,
+        max_seconds=args.time_limit,
+    )
+    if args.format == "text":
+        worker = partial(report, analyses=analyses, limits=limits)
+    else:
+        worker = partial(record, analyses=analyses, limits=limits, digest=args.hash)
+    writer = output.writer(args.format, out, record_columns(analyses))
+    
+    results = None
+    if args.cache is not None:
+        # Records with and without the optional analyses, or made under other
+        # limits, mustn't be mixed up
+        version = schema_version() + ":" + ",".join(sorted(analyses)) + ":" + repr(limits)
+        results = cache.ResultCache(args.cache, version, args.cache_size << 20)
+        worker = partial(cached_record, args.cache, analyses, limits)
+    
+    profiler = None
+    if args.profile is not None:
+        profiler = instrument.enable()
+        worker = partial(instrument.collect, worker)
+    
+    single = len(args.targets) == 1 and args.file_list is None and results is None and args.aio is None
+    target = args.targets[0] if args.targets else None
+    
+    with writer:
+        if single and not Path(target).is_dir() and not batch.is_pattern(target):
+            # Same error handling as a batch, so a bad file is a record, not a traceback
+            scanned = batch.run_chunk(worker, [target])
+        else:
+            scanned = []
+            paths = batch.iter_paths(args.targets, args.file_list)
+            if args.aio is not None:
+                asyncio.run(scan_async(paths, args.aio, writer, args.format, limits))
+            else:
+                if results is not None:
+                    paths = uncached(paths, results, writer)
+                scanned = batch.scan(paths, worker, args.workers, args.chunksize)
+        
+        for result in scanned:
+            if result.error is not None:
+                instrument.count("errors")
+                writer.error(result.path, result.error)
+                continue
+            
+            value = result.value
+            if profiler is not None:
+                value, stats = value
+                profiler.merge(stats)
+            
+            if results is not None:
+                size, mtime, digest, value = value
+                results.put(result.path, size, mtime, digest, value)
+            writer.write(value)
+    
+    if results is not None:
+        results.close()
+    
+    if profiler is not None:
+        with open(args.profile, "w") as f:
+            f.write(profiler.to_prometheus() if args.profile_format == "prometheus" else profiler.to_json())
 
 if __name__ == "__main__":
-    if not len(sys.argv) == 2:
-        print(f"Usage python {sys.argv[0]} <filename>")
+    parser = argparse.ArgumentParser(description="Examine the headers of PE files")
+    parser.add_argument("targets", nargs="*", help="files, directories or glob patterns, - reads a file from stdin")
+    parser.add_argument("-l", "--file-list", help="read paths to scan from this file, - for stdin")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes for batch scans (default: all cores)")
+    parser.add_argument("-c", "--chunksize", type=int, default=16, help="files handed to a worker at a time")
+    parser.add_argument("-f", "--format", choices=["text", "jsonl", "csv"], default="text", help="output format")
+    parser.add_argument("-o", "--output", help="write results to this file instead of stdout")
+    parser.add_argument("--imports", dest="analyses", action="append_const", const="imports", help="list imported DLLs and functions")
+    parser.add_argument("--exports", dest="analyses", action="append_const", const="exports", help="list exported functions")
+    parser.add_argument("--section-analysis", dest="analyses", action="append_const", const="section_analysis", help="hash each section and measure its entropy")
+    parser.add_argument("--verify", dest="analyses", action="append_const", const="verification", help="verify the PE checksum and the Authenticode digest")
+    parser.add_argument("--resources", dest="analyses", action="append_const", const="resources", help="walk the resource tree")
+    parser.add_argument("--version-info", dest="analyses", action="append_const", const="version_info", help="extract version information strings")
+    parser.add_argument("--relocations", dest="analyses", action="append_const", const="relocations", help="count base relocations by type")
+    parser.add_argument("--hash", action="store_true", help="add the SHA-256 of each file to the records, to match files by content in compare.py")
+    parser.add_argument("--max-sections", type=int, default=validation.LIMITS.max_sections, help="read at most this many section headers")
+    parser.add_argument("--work-limit", type=int, default=validation.LIMITS.max_work >> 20, help="MB the analyses may read per file")
+    parser.add_argument("--time-limit", type=float, default=validation.LIMITS.max_seconds, help="seconds the analyses may take per file")
+    parser.add_argument("--aio", type=int, metavar="READS", help="scan headers with asyncio, keeping up to READS reads in flight (for high latency storage)")
+    parser.add_argument("--profile", metavar="FILE", help="time each parsing stage and write the numbers to FILE after the run")
+    parser.add_argument("--profile-format", choices=["json", "prometheus"], default="json", help="format of the --profile output")
+    parser.add_argument("--cache", help="reuse results for unchanged files from this cache database")
+    parser.add_argument("--cache-size", type=int, default=1024, help="maximum cache size in MB")
+    args = parser.parse_args()
+    
+    if not args.targets and args.file_list is None:
+        parser.print_usage()
         exit()
-    main(sys.argv[1])
\ No newline at end of file
+    
+    if args.cache is not None and args.format == "text":
+        parser.error("--cache needs a structured output format (-f jsonl or -f csv)")
+    
+    if args.aio is not None and (args.cache is not None or args.analyses):
+        parser.error("--aio only reads the headers, it can't be combined with --cache or deeper analysis")
+    main(args)
@@ -0,0 +1,343 @@
+import os
+import struct
+import random
+import argparse
+from dataclasses import dataclass
+from typing import Callable
+
+# Data directory indices
+EXPORT = 0
+IMPORT = 1
+RESOURCE = 2
+CERTIFICATE = 4
+BASE_RELOCATION = 5
+
+CODE = 0x60000020
+DATA = 0xc0000040
+RDATA = 0x40000040
+
+FILE_ALIGNMENT = 0x200
+SECTION_ALIGNMENT = 0x1000
+PE_HEADER = 0x80
+
+@dataclass
+class Section:
+    name: str
+    # Either the raw data or a function of the section's RVA returning it
+    data: bytes | Callable[[int], bytes] = b""
+    flags: int = CODE
+    virtual_size: int | None = None
+    directory: int | None = None
+
+def align(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+def pe(plus=False, sections=(), certificate=b"", timestamp=0x5f000000, dll=False):
+    sections = list(sections) or [Section(".text", b"\xc3" * 0x200)]
+    optional_size = 240 if plus else 224
+    headers_size = align(PE_HEADER + 24 + optional_size + 40 * len(sections), FILE_ALIGNMENT)
+    
+    layout = []
+    directories = {}
+    pointer = headers_size
+    address = SECTION_ALIGNMENT
+    for section in sections:
+        data = section.data(address) if callable(section.data) else section.data
+        virtual_size = section.virtual_size or len(data)
+        layout.append((section, data, virtual_size, address, pointer))
+        if section.directory is not None:
+            directories[section.directory] = (address, len(data))
+        pointer += align(len(data), FILE_ALIGNMENT)
+        address += align(max(virtual_size, 1), SECTION_ALIGNMENT)
+    
+    out = bytearray(pointer)
+    out[0:2] = b"MZ"
+    struct.pack_into("<I", out, 0x3c, PE_HEADER)
+    
+    characteristics = (0x0022 if plus else 0x0102) | (0x2000 if dll else 0)
+    machine = 0x8664 if plus else 0x14c
+    struct.pack_into("<4sHHIIIHH", out, PE_HEADER, b"PE\0\0", machine, len(sections), timestamp, 0, 0, optional_size, characteristics)
+    
+    o = PE_HEADER + 24
+    struct.pack_into("<HBBIIIII", out, o, 0x20b if plus else 0x10b, 14, 2, 0x200, 0x200, 0, SECTION_ALIGNMENT, SECTION_ALIGNMENT)
+    if plus:
+        struct.pack_into("<Q", out, o + 24, 0x140000000)
+    else:
+        struct.pack_into("<II", out, o + 24, 0x2000, 0x400000)
+    struct.pack_into("<IIHHHHHHIIIIHH", out, o + 32, SECTION_ALIGNMENT, FILE_ALIGNMENT, 6, 0, 0, 0, 6, 0, 0, address, headers_size, 0, 3, 0x8160)
+    
+    if plus:
+        struct.pack_into("<QQQQII", out, o + 72, 0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+        table = o + 112
+    else:
+        struct.pack_into("<IIIIII", out, o + 72, 0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+        table = o + 96
+    
+    for index, (rva, size) in directories.items():
+        struct.pack_into("<II", out, table + 8 * index, rva, size)
+    
+    start = o + optional_size
+    for i, (section, data, virtual_size, rva, raw) in enumerate(layout):
+        raw_size = align(len(data), FILE_ALIGNMENT)
+        struct.pack_into("<8sIIIIIIHHI", out, start + 40 * i, section.name.encode()[:8], virtual_size, rva, raw_size, raw, 0, 0, 0, 0, section.flags)
+        out[raw:raw + len(data)] = data
+    
+    if certificate:
+        # The certificate table holds a file offset, not an RVA
+        struct.pack_into("<II", out, table + 8 * CERTIFICATE, len(out), len(certificate))
+        out += certificate
+    
+    return bytes(out)
+
+def imports(dlls, plus=False):
+    # dlls maps a DLL name to its functions, names or ordinals
+    def build(va):
+        width = 8 if plus else 4
+        by_ordinal = 1 << 63 if plus else 1 << 31
+        descriptors = 20 * (len(dlls) + 1)
+        strings_start = descriptors + width * sum(len(functions) + 1 for functions in dlls.values())
+        
+        thunks = bytearray()
+        strings = bytearray()
+        table = bytearray(descriptors)
+        for i, (dll, functions) in enumerate(dlls.items()):
+            first = va + descriptors + len(thunks)
+            for function in functions:
+                if isinstance(function, int):
+                    entry = by_ordinal | function
+                else:
+                    entry = va + strings_start + len(strings)
+                    strings += struct.pack("<H", 0) + function.encode() + b"\0"
+                    strings += b"\0" * (len(strings) % 2)
+                thunks += entry.to_bytes(width, "little")
+            thunks += bytes(width)
+            
+            name = va + strings_start + len(strings)
+            strings += dll.encode() + b"\0"
+            struct.pack_into("<IIIII", table, 20 * i, first, 0, 0, name, first)
+        
+        return bytes(table + thunks + strings)
+    
+    return build
+
+def exports(dll, names, base=1):
+    def build(va):
+        names_sorted = sorted(names)
+        count = len(names_sorted)
+        functions = 40
+        name_table = functions + 4 * count
+        ordinal_table = name_table + 4 * count
+        strings_start = ordinal_table + 2 * count
+        
+        strings = bytearray()
+        def string(s):
+            rva = va + strings_start + len(strings)
+            strings.extend(s.encode() + b"\0")
+            return rva
+        
+        out = bytearray(strings_start)
+        struct.pack_into(
+            "<IIHHIIIIIII", out, 0,
+            0, 0, 0, 0, string(dll), base, count, count,
+            va + functions, va + name_table, va + ordinal_table,
+        )
+        for i, name in enumerate(names_sorted):
+            struct.pack_into("<I", out, functions + 4 * i, SECTION_ALIGNMENT + i)
+            struct.pack_into("<I", out, name_table + 4 * i, string(name))
+            struct.pack_into("<H", out, ordinal_table + 2 * i, i)
+        
+        return bytes(out + strings)
+    
+    return build
+
+def version_block(key, value=b"", text=False, children=b""):
+    key = key.encode("utf-16-le") + b"\0\0"
+    body = key + b"\0" * (-(6 + len(key)) % 4) + value
+    body += b"\0" * (-(6 + len(body)) % 4) + children
+    length = len(value) // 2 if text else len(value)
+    return struct.pack("<HHH", 6 + len(body), length, 1 if text else 0) + body
+
+def pad4(data):
+    return data + b"\0" * (-len(data) % 4)
+
+def version_info(strings):
+    fixed = struct.pack("<13I", 0xfeef04bd, 0x10000, 0x10002, 0x30004, 0x10002, 0x30004, 0x3f, 0, 4, 1, 0, 0, 0)
+    table = b"".join(pad4(version_block(k, (v + "\0").encode("utf-16-le"), True)) for k, v in strings.items())
+    string_info = version_block("StringFileInfo", children=pad4(version_block("040904b0", children=table)))
+    return version_block("VS_VERSION_INFO", fixed, children=pad4(string_info))
+
+def resources(leaves):
+    # leaves are (type id, name id, language id, data), laid out as the usual three level tree
+    def build(va):
+        tree = {}
+        for kind, name, language, data in leaves:
+            tree.setdefault(kind, {}).setdefault(name, {})[language] = data
+        
+        # Breadth first: the root, a directory per type, then one per name.
+        # Entries are (id, index of the child directory or None, data)
+        kinds = sorted(tree)
+        directories = [[(kind, 1 + i, None) for i, kind in enumerate(kinds)]]
+        languages = []
+        for kind in kinds:
+            entries = []
+            for name in sorted(tree[kind]):
+                entries.append((name, 1 + len(kinds) + len(languages), None))
+                languages.append([(language, None, data) for language, data in sorted(tree[kind][name].items())])
+            directories.append(entries)
+        directories += languages
+        
+        sizes = [16 + 8 * len(entries) for entries in directories]
+        offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+        entries_start = sum(sizes)
+        data_start = align(entries_start + 16 * len(leaves), 8)
+        
+        out = bytearray()
+        blobs = bytearray()
+        data_entries = bytearray()
+        for entries in directories:
+            out += struct.pack("<IIHHHH", 0, 0, 0, 0, 0, len(entries))
+            for key, child, data in entries:
+                if child is not None:
+                    out += struct.pack("<II", key, 0x80000000 | offsets[child])
+                else:
+                    out += struct.pack("<II", key, entries_start + len(data_entries))
+                    data_entries += struct.pack("<IIII", va + data_start + len(blobs), len(data), 1252, 0)
+                    blobs += data + b"\0" * (-len(data) % 8)
+        
+        out += data_entries
+        out += b"\0" * (data_start - len(out))
+        return bytes(out + blobs)
+    
+    return build
+
+def relocations(targets, plus=False):
+    # targets are RVAs of pointers to fix up, grouped into one block per 4K page
+    kind = 10 if plus else 3
+    pages = {}
+    for rva in sorted(targets):
+        pages.setdefault(rva & ~0xfff, []).append(kind << 12 | rva & 0xfff)
+    
+    out = bytearray()
+    for page, entries in pages.items():
+        # Blocks stay 32 bit aligned with an ABSOLUTE entry as padding
+        entries += [0] * (len(entries) % 2)
+        out += struct.pack(f"<II{len(entries)}H", page, 8 + 2 * len(entries), *entries)
+    return bytes(out)
+
+def pkcs7(digest):
+    # Just enough of a signature for the Authenticode digest to be found
+    def der(tag, body):
+        n = len(body)
+        length = bytes([n]) if n < 0x80 else bytes([0x80 | ((n.bit_length() + 7) // 8)]) + n.to_bytes((n.bit_length() + 7) // 8, "big")
+        return bytes([tag]) + length + body
+    
+    algorithm = der(0x30, der(0x06, bytes.fromhex("608648016503040201")) + der(0x05, b""))
+    indirect = der(0x30, der(0x30, der(0x06, bytes.fromhex("2b06010401823702010f"))) + der(0x30, algorithm + der(0x04, digest)))
+    content = der(0x30, der(0x06, bytes.fromhex("2b060104018237020104")) + der(0xa0, indirect))
+    signed = der(0x30, der(0x02, b"\x01") + der(0x31, algorithm) + content + der(0x31, b""))
+    return der(0x30, der(0x06, bytes.fromhex("2a864886f70d010702")) + der(0xa0, signed))
+
+def certificate(digest=bytes(32)):
+    data = struct.pack("<IHH", 8 + len(pkcs7(digest)), 0x200, 2) + pkcs7(digest)
+    return data + b"\0" * (-len(data) % 8)
+
+def truncate(data, rng):
+    return data[:rng.randrange(PE_HEADER, min(len(data), 1024))]
+
+def bad_magic(data, rng):
+    return b"ZM" + data[2:]
+
+def bad_optional_magic(data, rng):
+    return data[:PE_HEADER + 24] + b"\x0b\x07" + data[PE_HEADER + 26:]
+
+def header_out_of_bounds(data, rng):
+    return data[:0x3c] + struct.pack("<I", rng.randrange(len(data), 1 << 31)) + data[0x40:]
+
+def many_sections(data, rng):
+    return data[:PE_HEADER + 6] + struct.pack("<H", 0xffff) + data[PE_HEADER + 8:]
+
+def overlapping_sections(data, rng):
+    # Every section claims the RVA of the first one
+    data = bytearray(data)
+    count, optional_size = struct.unpack_from("<H12xH", data, PE_HEADER + 6)
+    table = PE_HEADER + 24 + optional_size
+    for i in range(1, count):
+        struct.pack_into("<I", data, table + 40 * i + 12, SECTION_ALIGNMENT)
+    return bytes(data)
+
+MALFORMATIONS = {
+    "truncated": truncate,
+    "bad-magic": bad_magic,
+    "bad-optional-magic": bad_optional_magic,
+    "header-out-of-bounds": header_out_of_bounds,
+    "many-sections": many_sections,
+    "overlapping-sections": overlapping_sections,
+}
+
+def sample(rng, plus=None, sections=None, size=0, directories=True, signed=False, malformation=None):
+    # One random but reproducible file, the same rng state always builds the same bytes
+    plus = rng.random() < 0.5 if plus is None else plus
+    count = rng.randint(1, 8) if sections is None else sections
+    
+    table = [Section(".text", rng.randbytes(rng.randint(0x100, 0x2000)))]
+    if directories:
+        dlls = {
+            f"lib{i}.dll": [f"Function{i}_{j}" if j % 5 else j + 1 for j in range(rng.randint(1, 40))]
+            for i in range(rng.randint(1, 6))
+        }
+        table.append(Section(".idata", imports(dlls, plus), DATA, directory=IMPORT))
+        table.append(Section(".edata", exports("sample.dll", [f"Export{i}" for i in range(rng.randint(1, 200))]), RDATA, directory=EXPORT))
+        version = version_info({"CompanyName": "Example", "FileVersion": f"1.{rng.randint(0, 99)}", "ProductName": "Synthetic"})
+        table.append(Section(".rsrc", resources([(16, 1, 1033, version), (10, 7, 1033, rng.randbytes(64))]), RDATA, directory=RESOURCE))
+        width = 8 if plus else 4
+        fixups = [SECTION_ALIGNMENT + width * i for i in range(0, len(table[0].data) // width, rng.randint(1, 8))]
+        table.append(Section(".reloc", relocations(fixups, plus), RDATA, directory=BASE_RELOCATION))
+    
+    while len(table) < count:
+        table.append(Section(f".s{len(table)}", rng.randbytes(rng.randint(0x10, 0x400)), DATA))
+    table = table[:max(count, 1)]
+    
+    if size:
+        # Padding to the requested size, repeated so large files stay cheap to build
+        filler = rng.randbytes(4096)
+        used = sum(align(len(s.data if isinstance(s.data, bytes) else b""), FILE_ALIGNMENT) for s in table)
+        table.append(Section(".data", (filler * (max(size - used, 0) // 4096 + 1))[:max(size - used, 0)], DATA))
+    
+    data = pe(plus, table, certificate() if signed else b"", rng.randint(0, 1 << 31), rng.random() < 0.3)
+    if malformation is not None:
+        data = MALFORMATIONS[malformation](data, rng)
+    return data
+
+def generate(directory, count, seed=0, malformed=0.05, **kwargs):
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    kinds = sorted(MALFORMATIONS)
+    paths = []
+    
+    for i in range(count):
+        malformation = rng.choice(kinds) if rng.random() < malformed else None
+        path = os.path.join(directory, f"sample{i:06}.{'dll' if i % 3 == 0 else 'exe'}")
+        with open(path, "wb") as f:
+            f.write(sample(rng, malformation=malformation, **kwargs))
+        paths.append(path)
+    
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible corpus of synthetic PE files")
+    parser.add_argument("directory", help="where to write the files")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="number of files")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--malformed", type=float, default=0.05, help="share of files with a malformation")
+    parser.add_argument("--sections", type=int, help="sections per file (default: random)")
+    parser.add_argument("--size", type=int, default=0, help="pad files to about this many bytes")
+    parser.add_argument("--pe32", dest="plus", action="store_false", default=None, help="only PE32 files")
+    parser.add_argument("--pe32plus", dest="plus", action="store_true", help="only PE32+ files")
+    parser.add_argument("--no-directories", dest="directories", action="store_false", help="leave out imports, exports and resources")
+    parser.add_argument("--signed", action="store_true", help="append a certificate table")
+    args = parser.parse_args()
+    
+    generate(
+        args.directory, args.count, args.seed, args.malformed,
+        plus=args.plus, sections=args.sections, size=args.size, directories=args.directories, signed=args.signed,
+    )
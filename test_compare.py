@@ -0,0 +1,38 @@
+import pytest
+
+import compare
+
+def scanned(path, sha256=None, machine=332, sections=(".text",)):
+    record = {
+        "path": path,
+        "format": "PE32",
+        "coff": {"machine_type": machine},
+        "sections": [{"header_name": name.encode().ljust(8, b"\x00").hex(), "virtual_size": 0x200} for name in sections],
+    }
+    if sha256 is not None:
+        record["sha256"] = sha256
+    return record
+
+def test_merge_join_pairs_by_key():
+    old = [scanned("/old/a.exe"), scanned("/old/b.exe"), scanned("/old/c.exe")]
+    new = [scanned("/new/c.exe", machine=34404), scanned("/new/a.exe"), scanned("/new/d.exe")]
+    # A run size of 1 spills every record, which goes through the heap merge
+    for run_size in (1, 1000):
+        differences = list(compare.diff_results(old, new, old_root="/old", new_root="/new", run_size=run_size))
+        assert differences == [
+            compare.Difference("b.exe", "file", "/old/b.exe", None),
+            compare.Difference("c.exe", "coff.machine_type", 332, 34404),
+            compare.Difference("d.exe", "file", None, "/new/d.exe"),
+        ]
+
+def test_hash_key_pairs_renamed_files():
+    old = [scanned("/a/one.exe", "11"), scanned("/a/two.exe", "22")]
+    new = [scanned("/b/renamed.exe", "22", sections=(".text", ".rsrc")), scanned("/b/one.exe", "11")]
+    differences = list(compare.diff_results(old, new, key="hash"))
+    assert differences == [compare.Difference("22", "sections..rsrc", None, "present")]
+
+def test_hash_key_needs_hashes():
+    old = [scanned("/a/one.exe", "11")]
+    new = [scanned("/b/one.exe")]
+    with pytest.raises(ValueError, match="no sha256"):
+        list(compare.diff_results(old, new, key="hash"))
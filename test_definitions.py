@@ -0,0 +1,36 @@
+import definitions as defs
+
+def names(enum, value):
+    return [name for name, _ in defs.decode(enum, value)]
+
+def test_enum_values():
+    assert defs.decode(defs.MachineType, 0x8664) == (("IMAGE_FILE_MACHINE_AMD64", defs.MachineType.desc("IMAGE_FILE_MACHINE_AMD64")),)
+    assert names(defs.WindowsSubsystem, 1) == ["IMAGE_SUBSYSTEM_NATIVE"]
+    # Zero is a member of plain enums
+    assert names(defs.MachineType, 0) == ["IMAGE_FILE_MACHINE_UNKNOWN"]
+
+def test_unknown_enum_value():
+    assert defs.decode(defs.MachineType, 0x1234) == (("0x1234", "Unknown value 0x1234"),)
+
+def test_flags_in_bit_order():
+    assert names(defs.Characteristics, 0x2102) == [
+        "IMAGE_FILE_EXECUTABLE_IMAGE",
+        "IMAGE_FILE_32BIT_MACHINE",
+        "IMAGE_FILE_DLL",
+    ]
+    assert defs.decode(defs.Characteristics, 0) == ()
+
+def test_unknown_flags_are_grouped():
+    pairs = defs.decode(defs.Characteristics, 0x30002)
+    assert pairs[0][0] == "IMAGE_FILE_EXECUTABLE_IMAGE"
+    assert pairs[1:] == (("0x30000", "Unknown flags 0x30000"),)
+
+def test_section_alignment_field():
+    # The alignment is a four bit number, not four flags
+    assert names(defs.SectionFlags, 0x60500020) == [
+        "IMAGE_SCN_CNT_CODE",
+        "IMAGE_SCN_ALIGN_16BYTES",
+        "IMAGE_SCN_MEM_EXECUTE",
+        "IMAGE_SCN_MEM_READ",
+    ]
+    assert names(defs.SectionFlags, 0x00F00000) == ["0xf00000"]
@@ -0,0 +1,81 @@
+import json
+import importlib
+
+import pytest
+
+import index
+import synthetic
+
+pe = importlib.import_module("pe-examine")
+
+def corpus(tmp_path):
+    files = {
+        "app.exe": synthetic.pe(timestamp=1000),
+        "lib.dll": synthetic.pe(plus=True, dll=True, timestamp=2000),
+        # A section that is both writable and executable
+        "packed.exe": synthetic.pe(plus=True, timestamp=3000, sections=[
+            synthetic.Section(".text", b"\xc3" * 0x200),
+            synthetic.Section("UPX1", b"\x90" * 0x200, synthetic.CODE | 0x80000000),
+        ]),
+    }
+    records = []
+    for name, data in files.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        records.append(pe.record(path))
+    records.append({"path": str(tmp_path / "broken.exe"), "error": "ValueError: truncated"})
+    
+    with index.IndexBuilder(tmp_path / "index") as builder:
+        for record in records:
+            builder.add(record)
+    return index.CorpusIndex(tmp_path / "index"), records
+
+def query(corpus, *conditions):
+    mask = None
+    for text in conditions:
+        part = index.condition(corpus, text)
+        mask = part if mask is None else mask & part
+    return [path.rsplit("/", 1)[-1] for path in corpus.paths(mask)]
+
+def test_columns_round_trip(tmp_path):
+    corpus_index, records = corpus(tmp_path)
+    # Errors are left out
+    assert corpus_index.rows == 3
+    assert list(corpus_index.columns["timestamp"]) == [1000, 2000, 3000]
+    assert list(corpus_index.columns["machine"]) == [record["coff"]["machine_type"] for record in records[:3]]
+    assert list(corpus_index.columns["plus"]) == [0, 1, 1]
+    assert list(corpus_index.columns["section_count"]) == [1, 1, 2]
+    assert list(corpus_index.section.columns["file"]) == [0, 1, 2, 2]
+
+def test_queries(tmp_path):
+    corpus_index, _ = corpus(tmp_path)
+    assert query(corpus_index, "machine=AMD64") == ["lib.dll", "packed.exe"]
+    assert query(corpus_index, "machine=0x14c") == ["app.exe"]
+    assert query(corpus_index, "characteristics&DLL") == ["lib.dll"]
+    assert query(corpus_index, "characteristics!&DLL", "timestamp>1000") == ["packed.exe"]
+    assert query(corpus_index, "timestamp<=2000") == ["app.exe", "lib.dll"]
+    assert query(corpus_index, "section.flags&MEM_EXECUTE|MEM_WRITE") == ["packed.exe"]
+    assert query(corpus_index, "section.flags&MEM_EXECUTE") == ["app.exe", "lib.dll", "packed.exe"]
+    
+    mask = index.condition(corpus_index, "characteristics&DLL") | index.condition(corpus_index, "timestamp=1000")
+    assert len(mask) == 2
+
+def test_bad_conditions(tmp_path):
+    corpus_index, _ = corpus(tmp_path)
+    with pytest.raises(ValueError, match="unknown machine value"):
+        index.condition(corpus_index, "machine=NOT_A_MACHINE")
+    with pytest.raises(ValueError, match="no operator"):
+        index.condition(corpus_index, "machine")
+    with pytest.raises(AttributeError):
+        index.condition(corpus_index, "colour=1")
+
+def test_other_byteorder(tmp_path):
+    corpus(tmp_path)
+    meta_path = tmp_path / "index" / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta["byteorder"] = "big" if meta["byteorder"] == "little" else "little"
+    meta_path.write_text(json.dumps(meta))
+    
+    # The same bytes read as the other byte order
+    swapped = index.CorpusIndex(tmp_path / "index")
+    assert list(swapped.columns["timestamp"]) == [int.from_bytes(n.to_bytes(4, "little"), "big") for n in (1000, 2000, 3000)]
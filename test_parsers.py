@@ -0,0 +1,270 @@
+import os
+import struct
+import hashlib
+import threading
+import importlib
+
+import analysis
+import directories
+import synthetic
+import validation
+
+pe = importlib.import_module("pe-examine")
+
+# Offsets into the PE32 optional header of the files synthetic.pe() builds
+CHECKSUM = synthetic.PE_HEADER + 24 + 64
+DATA_DIRECTORIES = synthetic.PE_HEADER + 24 + 96
+
+def write(tmp_path, data, name="sample.exe"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+def test_section_index_later_section_wins():
+    index = directories.SectionIndex([
+        (0x1000, 0x3000, 0x400, 0x3000),
+        (0x2000, 0x1000, 0x3000, 0x800),
+    ], headers_size=0x400)
+    
+    assert index.lookup(0x1010) == 0x410
+    # Overlapped by the second section
+    assert index.lookup(0x2010) == 0x3010
+    # Past the second section's raw data it is zero filled
+    assert index.lookup(0x2900) is None
+    # The first section again after the overlap
+    assert index.lookup(0x3010) == 0x2410
+    assert index.lookup(0x10) == 0x10
+    assert index.lookup(0x5000) is None
+
+def test_overlapping_sections_resolve_like_the_loader(tmp_path):
+    data = synthetic.pe(sections=[
+        synthetic.Section(".a", b"\x01" * 0x200),
+        synthetic.Section(".b", b"\x02" * 0x200),
+    ])
+    data = synthetic.overlapping_sections(data, None)
+    
+    with pe.Executable(write(tmp_path, data)) as exe:
+        offset = exe.rva_to_offset(synthetic.SECTION_ALIGNMENT)
+        assert exe.content[offset] == 2
+
+def test_checksum_matches_the_word_sum(tmp_path):
+    data = bytearray(synthetic.pe(sections=[synthetic.Section(".text", bytes(range(256)) * 3 + b"\x07")]))
+    # An odd length exercises the padding of the last word
+    data += b"\xff"
+    offset = CHECKSUM
+    
+    total = 0
+    padded = bytes(data) + b"\x00" * (len(data) % 2)
+    for i, (word,) in enumerate(struct.iter_unpack("<H", padded)):
+        if offset <= 2 * i < offset + 4:
+            continue
+        total += word
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    expected = total + len(data)
+    
+    struct.pack_into("<I", data, offset, expected)
+    content = pe.PrefixContent(bytes(data))
+    # Odd chunk sizes move the word boundaries between chunks
+    for chunk_size in (7, 4096, 1 << 20):
+        result = analysis.verify(content, offset, 0, 0, 0, chunk_size)
+        assert result.checksum == expected
+        assert result.checksum_ok
+
+def authenticode_digest(data):
+    # Everything but the checksum, the certificate table entry and the table itself
+    offset = CHECKSUM
+    entry = DATA_DIRECTORIES + 8 * synthetic.CERTIFICATE
+    start, size = struct.unpack_from("<II", data, entry)
+    kept = data[:offset] + data[offset + 4:entry] + data[entry + 8:start] + data[start + size:]
+    return hashlib.sha256(kept).digest()
+
+def test_authenticode_digest(tmp_path):
+    sections = [synthetic.Section(".text", b"\xc3" * 0x300)]
+    unsigned = synthetic.pe(sections=sections, certificate=synthetic.certificate())
+    digest = authenticode_digest(unsigned)
+    
+    signed = synthetic.pe(sections=sections, certificate=synthetic.certificate(digest))
+    with pe.Executable(write(tmp_path, signed)) as exe:
+        result = exe.analyse("verification")[0]
+        assert result.digest == digest.hex()
+        assert result.signature_ok
+    
+    with pe.Executable(write(tmp_path, unsigned, "unsigned.exe")) as exe:
+        assert exe.analyse("verification")[0].signature_ok is False
+
+def resource_file(tmp_path, leaves):
+    data = synthetic.pe(sections=[
+        synthetic.Section(".text", b"\xc3" * 0x200),
+        synthetic.Section(".rsrc", synthetic.resources(leaves), synthetic.RDATA, directory=synthetic.RESOURCE),
+    ])
+    return write(tmp_path, data)
+
+def test_resources_walk_and_read(tmp_path):
+    leaves = [(10, name, 1033, bytes([name]) * 16) for name in range(1, 6)]
+    with pe.Executable(resource_file(tmp_path, leaves)) as exe:
+        found = list(exe.resources)
+        assert [leaf.path for leaf in found] == [("RT_RCDATA", name, 1033) for name in range(1, 6)]
+        view = exe.resources.read(found[2])
+        assert bytes(view) == b"\x03" * 16
+        view.release()
+
+def test_resource_entry_limit(tmp_path):
+    leaves = [(10, name, 1033, b"x") for name in range(1, 50)]
+    path = resource_file(tmp_path, leaves)
+    with pe.Executable(path, limits=validation.Limits(max_resource_entries=10)) as exe:
+        assert len(list(exe.resources)) < 10
+        assert "Entry limit reached" in exe.resources.errors
+
+def test_resource_depth_limit(tmp_path):
+    with pe.Executable(resource_file(tmp_path, [(10, 1, 1033, b"x")]), limits=validation.Limits(max_resource_depth=2)) as exe:
+        assert list(exe.resources) == []
+        assert any(error.startswith("Depth limit") for error in exe.resources.errors)
+
+def test_resource_cycle_ends():
+    # A root directory whose only entry points back at the root
+    tree = struct.pack("<IIHHHH", 0, 0, 0, 0, 0, 1) + struct.pack("<II", 3, 0x80000000)
+    content = pe.PrefixContent(tree)
+    resources = directories.ResourceTree(content, lambda rva: rva, 0, len(tree))
+    resources.root = 0
+    assert list(resources) == []
+    assert any("visited twice" in error for error in resources.errors)
+
+def test_resource_names_are_charged():
+    # A root directory with one named entry, the name after the entry
+    name = "ICON".encode("utf-16-le")
+    tree = struct.pack("<IIHHHH", 0, 0, 0, 0, 1, 0) + struct.pack("<II", 0x80000000 | 24, 0x80000000)
+    tree += struct.pack("<H", 4) + name
+    spent = []
+    resources = directories.ResourceTree(pe.PrefixContent(tree), lambda rva: rva, 0, len(tree), spend=spent.append)
+    resources.root = 0
+    assert resources.name(0x80000018, 0) == "ICON"
+    assert spent == [2 + len(name)]
+
+def test_relocations(tmp_path):
+    pointers = [synthetic.SECTION_ALIGNMENT + 8 * i for i in range(0, 40, 3)] + [2 * synthetic.SECTION_ALIGNMENT + 16]
+    code = bytearray(0x1200)
+    for rva in pointers:
+        struct.pack_into("<Q", code, rva - synthetic.SECTION_ALIGNMENT, 0x140001000 + rva)
+    
+    data = synthetic.pe(plus=True, sections=[
+        synthetic.Section(".text", bytes(code)),
+        synthetic.Section(".reloc", synthetic.relocations(pointers, plus=True), synthetic.RDATA, directory=synthetic.BASE_RELOCATION),
+    ])
+    
+    with pe.Executable(write(tmp_path, data)) as exe:
+        relocations = exe.relocations
+        counts = relocations.counts()
+        assert counts[10] == len(pointers)
+        assert sorted(int(rva) for rva in relocations.targets(10)) == sorted(pointers)
+        
+        image = exe.image()
+        relocations.rebase(image, 0x10000)
+        for rva in pointers:
+            assert struct.unpack_from("<Q", image, rva)[0] == 0x140011000 + rva
+
+def test_import_budget(tmp_path):
+    dlls = {f"lib{i}.dll": [f"Function{j}" for j in range(100)] for i in range(4)}
+    data = synthetic.pe(sections=[
+        synthetic.Section(".text", b"\xc3" * 0x200),
+        synthetic.Section(".idata", synthetic.imports(dlls), synthetic.DATA, directory=synthetic.IMPORT),
+    ])
+    path = write(tmp_path, data)
+    
+    with pe.Executable(path) as exe:
+        assert [len(dll.functions) for dll in exe.analyse("imports")] == [100] * 4
+    
+    with pe.Executable(path, limits=validation.Limits(max_imports=150)) as exe:
+        assert sum(len(dll.functions) for dll in exe.analyse("imports")) == 150
+        assert [a.kind for a in exe.anomalies] == ["too-many-imports"]
+    
+    with pe.Executable(path, limits=validation.Limits(max_work=1000)) as exe:
+        assert exe.analyse("imports") == []
+        assert [a.kind for a in exe.anomalies] == ["budget"]
+
+def relocation_block(page, entries):
+    # Padding in front, a relocation directory at RVA 0 would count as absent
+    block = struct.pack(f"<II{len(entries)}H", page, 8 + 2 * len(entries), *entries)
+    return directories.Relocations(pe.PrefixContent(bytes(8) + block), lambda rva: rva, 8, len(block))
+
+def test_rebase_highadj_low_half_is_signed():
+    relocations = relocation_block(0, [4 << 12 | 0x10, 0x9000])
+    image = bytearray(0x20)
+    struct.pack_into("<H", image, 0x10, 0x1234)
+    assert relocations.rebase(image, 0x10000) == 0
+    # 0x12340000 + (SHORT)0x9000 + 0x10000, rounded
+    assert struct.unpack_from("<H", image, 0x10)[0] == 0x1235
+
+def test_rebase_repeated_and_out_of_range_targets():
+    relocations = relocation_block(0, [3 << 12 | 0x8, 3 << 12 | 0x8, 3 << 12 | 0x1e, 3 << 12 | 0xffc])
+    image = bytearray(0x20)
+    struct.pack_into("<I", image, 0x8, 0x401000)
+    # Both entries for 0x8 apply, 0x1e and 0xffc run past the image
+    assert relocations.rebase(image, 0x100) == 2
+    assert struct.unpack_from("<I", image, 0x8)[0] == 0x401200
+
+def test_long_export_names(tmp_path):
+    # Longer than a read chunk, and alike for their first 300 bytes
+    names = ["?" + "x" * 300 + suffix for suffix in ("Alpha", "Beta", "Gamma")] + ["short"]
+    data = synthetic.pe(dll=True, sections=[
+        synthetic.Section(".text", b"\xc3" * 0x200),
+        synthetic.Section(".edata", synthetic.exports("long.dll", names), synthetic.RDATA, directory=synthetic.EXPORT),
+    ])
+    with pe.Executable(write(tmp_path, data)) as exe:
+        assert sorted(function.name for function in exe.exports) == sorted(names)
+        for name in names:
+            assert exe.exports.find(name).name == name
+        assert exe.exports.find("?" + "x" * 300) is None
+
+def test_read_headers_from_a_pipe(tmp_path):
+    data = synthetic.pe(sections=[synthetic.Section(".text", b"\xc3" * 0x200)])
+    path = tmp_path / "pipe"
+    os.mkfifo(path)
+    writer = threading.Thread(target=path.write_bytes, args=(data,))
+    writer.start()
+    # A pipe's size is 0, it has to be streamed rather than read by its size
+    with pe.Executable(path, pe.read_headers(path)) as exe:
+        assert exe.COFF.signature == b"PE\x00\x00"
+        assert exe.sections[0].header_name.rstrip(b"\x00") == b".text"
+    writer.join()
+
+def test_export_counts_past_the_file(tmp_path):
+    data = bytearray(synthetic.pe(dll=True, sections=[
+        synthetic.Section(".text", b"\xc3" * 0x200),
+        synthetic.Section(".edata", synthetic.exports("big.dll", ["a", "b"]), synthetic.RDATA, directory=synthetic.EXPORT),
+    ]))
+    with pe.Executable(write(tmp_path, bytes(data))) as exe:
+        offset = exe.rva_to_offset(exe.Data_dirs.export_table_address)
+    # NumberOfFunctions and NumberOfNames claim billions of entries
+    struct.pack_into("<II", data, offset + 20, 0x7fffffff, 0x7fffffff)
+    
+    with pe.Executable(write(tmp_path, bytes(data)), limits=validation.Limits(max_work=1 << 20)) as exe:
+        assert exe.analyse("exports")
+        assert "budget" not in [a.kind for a in exe.anomalies]
+
+def test_huge_sizes_render(tmp_path):
+    data = bytearray(synthetic.pe(plus=True, sections=[synthetic.Section(".text", b"\xc3" * 0x200)]))
+    # Size of Stack Reserve in the PE32+ optional header
+    struct.pack_into("<Q", data, synthetic.PE_HEADER + 24 + 72, 1 << 40)
+    path = write(tmp_path, bytes(data))
+    
+    assert "1.00 TB" in pe.report(path)
+    assert pe.record(path)
+    assert pe.bytes_str((1 << 64) - 1) == "16.00 EB"
+    assert pe.bytes_str(1 << 80) == "1048576.00 EB"
+
+def test_image_is_bounded_by_the_sections(tmp_path):
+    data = bytearray(synthetic.pe(sections=[synthetic.Section(".text", b"\xc3" * 0x200)]))
+    # Size of Image claims 3 GB
+    struct.pack_into("<I", data, synthetic.PE_HEADER + 24 + 56, 0xc0000000)
+    path = write(tmp_path, bytes(data))
+    
+    with pe.Executable(path) as exe:
+        image = exe.image()
+        assert len(image) == 2 * synthetic.SECTION_ALIGNMENT
+        assert image[synthetic.SECTION_ALIGNMENT] == 0xc3
+        assert [a.kind for a in exe.anomalies] == ["image-too-large"]
+    
+    with pe.Executable(path, limits=validation.Limits(max_image=0x1100)) as exe:
+        assert len(exe.image()) == 0x1100
+        assert [a.kind for a in exe.anomalies] == ["image-too-large"] * 2
@@ -0,0 +1,72 @@
+import time
+import struct
+from dataclasses import dataclass
+
+@dataclass(frozen=True, slots=True)
+class Limits:
+    # The Windows loader refuses images with more sections than this
+    max_sections: int = 96
+    max_dlls: int = 4096
+    max_functions: int = 65536
+    # Imported functions over all DLLs of a file
+    max_imports: int = 1 << 18
+    max_resource_depth: int = 8
+    max_resource_entries: int = 4096
+    # Bytes Executable.image() allocates for the mapped image
+    max_image: int = 1 << 30
+    # Per file budgets for the analyses, bytes read and wall clock seconds
+    max_work: int = 1 << 32
+    max_seconds: float = 30.0
+
+LIMITS = Limits()
+
+@dataclass(frozen=True, slots=True)
+class Anomaly:
+    kind: str
+    message: str
+    where: str | None = None
+    
+    def to_dict(self):
+        return {"kind": self.kind, "message": self.message, "where": self.where}
+    
+    def __str__(self):
+        message = self.message if self.where is None else f"{self.where}: {self.message}"
+        return f"{self.kind:>40} : {message}\n"
+
+class BudgetExceeded(Exception):
+    pass
+
+class Validator:
+    # Collects what is wrong with a file instead of failing on it, and keeps
+    # the analyses of a single file within the work and time budgets
+    def __init__(self, limits=None):
+        self.limits = limits or LIMITS
+        self.anomalies = []
+        self.work = 0
+        self.deadline = time.monotonic() + self.limits.max_seconds
+    
+    def report(self, kind, message, where=None):
+        self.anomalies.append(Anomaly(kind, message, where))
+    
+    def check_range(self, kind, start, size, length, where=None):
+        if start + size > length:
+            self.report(kind, f"{start + size - length} bytes past the end of the file at {hex(start)}", where)
+            return False
+        return True
+    
+    def spend(self, work=0):
+        self.work += work
+        if self.work > self.limits.max_work:
+            raise BudgetExceeded(f"over the work budget of {self.limits.max_work} bytes")
+        if time.monotonic() > self.deadline:
+            raise BudgetExceeded(f"over the time budget of {self.limits.max_seconds}s")
+    
+    def guard(self, name, fn, default):
+        try:
+            self.spend()
+            return fn()
+        except BudgetExceeded as e:
+            self.report("budget", str(e), name)
+        except (ValueError, IndexError, struct.error) as e:
+            self.report("malformed", f"{type(e).__name__}: {e}", name)
+        return default